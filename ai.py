@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+
+# Computer players. These search the moves on a Board with alpha-beta pruning,
+# going one move deeper each time until they run out of time, so they always
+# have an answer ready and get stronger the more time they are given
+import threading
+import time
+# Searching in another process needs Python 2.6. Without it (eg. in the frozen
+# version, which runs on 2.5) Bots think in a thread instead
+try:
+	import multiprocessing
+except ImportError:
+	multiprocessing = None
+from transposition import TranspositionTable
+from history import History
+
+# The score for winning, which is bigger than any count of particles
+WIN = 1000000
+
+# We never search deeper than this, even with time to spare
+MAX_DEPTH = 64
+
+# What a score stored in the transposition table means. Alpha-beta often only
+# finds out that a score is at least or at most some value
+EXACT = 0
+LOWER = 1		# The real score is at least this
+UPPER = 2		# The real score is at most this
+
+class Timeout(Exception):
+	# Raised inside a search when its time is up
+	pass
+
+class Result:
+	# What a search decided, and how much work it took to decide it
+
+	def __init__(self, move, score, depth, nodes, elapsed, budget, table=None):
+		self.move = move		# The cell to play
+		self.score = score		# How good that looks for us
+		self.depth = depth		# How many moves ahead we managed to look
+		self.nodes = nodes		# How many positions we looked at
+		self.elapsed = elapsed		# How long it took, in milliseconds
+		self.budget = budget		# How long we were allowed, in milliseconds
+		self.table = table		# The transposition table's statistics
+
+	def nodes_per_second(self):
+		"""Gives how many positions were looked at each second."""
+		if self.elapsed <= 0:
+			return 0
+		return int(self.nodes * 1000.0 / self.elapsed)
+
+class Search:
+	# A Search finds a move for whoever's turn it is on a Board. Everybody
+	# else is assumed to be playing against us, so with more than two players
+	# they all try to make our score as low as possible. Positions are
+	# States in a History rather than copies of the Board, so each one only
+	# costs the chunks its move changed, and a State remembers where each of
+	# its moves leads for the rest of the search
+
+	def __init__(self, board, budget, table=None):
+		"""budget is how many milliseconds we may take. table remembers the
+		scores and best moves of positions, and can be kept between searches
+		for the same player. board isn't changed."""
+		self.board = board
+		self.player = board.current		# Who we are choosing a move for
+		self.budget = budget
+		self.deadline = 0
+		self.nodes = 0
+		if table is None:
+			table = TranspositionTable()
+		self.table = table
+		self.history = History(board)
+		self.start = self.history.root		# The State we are searching from
+
+	def score(self, board):
+		"""Scores a position from our point of view."""
+		winner = board.winner()
+		if winner is not None:
+			if winner == self.player:
+				return WIN
+			return -WIN
+		if not board.cells[self.player]:
+			# Knocked out, even if the Board hasn't noticed yet
+			return -WIN
+		# Particles are what count in the end, and the player with the most
+		# of them is the one we need to worry about
+		theirs = [board.particles[player] for player in board.alive if player != self.player]
+		return board.particles[self.player] - max(theirs + [0])
+
+	def evaluate(self, state):
+		"""Scores a State from our point of view."""
+		return self.score(self.history.look(state))
+
+	def children(self, state, moves):
+		"""Gives (move, new State) for each of the moves."""
+		for move in moves:
+			# Chain reactions are the slow part, but branch only plays each
+			# move from a State once, however often the search comes back
+			yield move, self.history.branch(state, move)
+
+	def alphabeta(self, state, depth, alpha, beta):
+		"""Gives the score of state, looking depth moves ahead."""
+		self.nodes += 1
+		# Looking at the clock every node would slow us down noticeably
+		if self.nodes % 64 == 0 and time.time() > self.deadline:
+			raise Timeout
+		board = self.history.look(state)
+		if depth == 0 or board.winner() is not None:
+			return self.score(board)
+		moves = board.legal_moves()
+		# We may have already searched this position, reached another way or
+		# in the last, shallower, search
+		best = None
+		stored = self.table.lookup(state.hash)
+		if stored is not None:
+			stored_depth, score, bound, best = stored
+			if stored_depth >= depth and (bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha)):
+				return score
+			# Even if it wasn't searched deep enough, the move which was best
+			# then is likely to be best now, and trying it first makes
+			# alpha-beta cut off far more
+			if best in moves:
+				moves.remove(best)
+				moves.insert(0, best)
+		start_alpha = alpha
+		start_beta = beta
+		maximising = state.current == self.player
+		for move, child in self.children(state, moves):
+			score = self.alphabeta(child, depth - 1, alpha, beta)
+			if maximising and score > alpha:
+				alpha = score
+				best = move
+			elif not maximising and score < beta:
+				beta = score
+				best = move
+			if alpha >= beta:
+				break
+		# Work out what we actually found out before remembering it
+		if maximising:
+			score = alpha
+			if score <= start_alpha:
+				bound = UPPER
+			elif score >= beta:
+				bound = LOWER
+			else:
+				bound = EXACT
+		else:
+			score = beta
+			if score >= start_beta:
+				bound = LOWER
+			elif score <= alpha:
+				bound = UPPER
+			else:
+				bound = EXACT
+		self.table.store(state.hash, (depth, score, bound, best), depth)
+		return score
+
+	def root(self, depth, moves):
+		"""Searches every move to the given depth. Returns the best move and
+		its score."""
+		best = None
+		alpha = -WIN - 1
+		for move, child in self.children(self.start, moves):
+			score = self.alphabeta(child, depth - 1, alpha, WIN + 1)
+			if score > alpha:
+				best = move
+				alpha = score
+		return best, alpha
+
+	def run(self):
+		"""Searches deeper and deeper until time runs out. Returns a Result
+		for the deepest search which finished."""
+		start = time.time()
+		self.deadline = start + self.budget / 1000.0
+		self.table.new_search()
+		moves = self.board.legal_moves()
+		best, score, depth = moves[0], 0, 0
+		try:
+			for depth_to_try in range(1, MAX_DEPTH + 1):
+				move, value = self.root(depth_to_try, moves)
+				best, score, depth = move, value, depth_to_try
+				if abs(score) == WIN:
+					# Nothing deeper will change a won or lost game
+					break
+				# Look at the best move first next time, since it makes
+				# alpha-beta cut off far more
+				moves.remove(best)
+				moves.insert(0, best)
+		except Timeout:
+			pass
+		elapsed = (time.time() - start) * 1000.0
+		return Result(best, score, depth, self.nodes, elapsed, self.budget, self.table.statistics())
+
+# Each process keeps a transposition table for each player it searches for, so
+# a Bot remembers what it found out on earlier moves
+tables = {}
+
+def search(board, budget):
+	"""Finds a move for the current player on board within budget
+	milliseconds. Returns a Result."""
+	if board.current not in tables:
+		tables[board.current] = TranspositionTable()
+	return Search(board, budget, tables[board.current]).run()
+
+class Thinking(threading.Thread):
+	# Stands in for the result of a search in another process, for a search
+	# running in a thread of this one. The display carries on while it runs,
+	# if a little slower, since the thread shares the interpreter with it
+
+	def __init__(self, board, budget):
+		threading.Thread.__init__(self)
+		self.setDaemon(True)		# Don't keep the game open once it's closed
+		self.board = board
+		self.budget = budget
+		self.result = None
+		self.start()
+
+	def run(self):
+		self.result = search(self.board, self.budget)
+
+	def ready(self):
+		return not self.isAlive()
+
+	def get(self):
+		return self.result
+
+class Bot:
+	# A computer player. Its searches run in a separate process, so that
+	# thinking doesn't stop the display from updating or the electrons from
+	# moving
+
+	def __init__(self, budget=500):
+		"""budget is how many milliseconds the Bot may think for each move."""
+		self.budget = budget
+		self.pool = None		# Made when first needed
+		self.pending = None		# The search we are waiting for
+
+	def think(self, board):
+		"""Start looking for a move on (a copy of) board. Use poll to find out
+		when it's done."""
+		if multiprocessing is None:
+			self.pending = Thinking(board.copy(), self.budget)
+			return
+		if self.pool is None:
+			self.pool = multiprocessing.Pool(1)
+		self.pending = self.pool.apply_async(search, (board, self.budget))
+
+	def poll(self):
+		"""Gives the Result of the search started by think if it has finished,
+		or None if it is still going."""
+		if self.pending is None or not self.pending.ready():
+			return None
+		result = self.pending.get()
+		self.pending = None
+		return result
+
+	def close(self):
+		"""Shut down the process doing the searching."""
+		if self.pool is not None:
+			self.pool.terminate()
+			self.pool = None
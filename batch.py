@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+# Many games at once. A Batch holds N boards of the same size and shape as
+# NumPy arrays of shape (N, cells), numbered as on a Board, and plays one move
+# on every board at the same time. Chain reactions are resolved a wave at a
+# time for all the boards together: every cell at or over its limit loses
+# that many particles, and each cell gathers the particles sent to it from
+# the cells which have it as a neighbour, using a table made once from the
+# Topology. This follows the same rules as Board, wave for wave, so the
+# results are the same as playing each game on its own Board. NumPy is
+# required
+import numpy
+from array import array
+from board import Board, NOBODY, explosion_limit
+import topology as shapes
+
+def senders(topology):
+	"""Gives a (cells, most senders) array of the cells which send a
+	particle to each cell when they explode, once for each particle. Rows
+	are padded with the cell number one past the end."""
+	sending = [[] for cell in xrange(topology.size)]
+	for cell in xrange(topology.size):
+		for neighbour in topology.lists[cell]:
+			sending[neighbour].append(cell)
+	most = max([len(cells) for cells in sending] + [1])
+	table = numpy.zeros((topology.size, most), numpy.intp) + topology.size
+	for cell, cells in enumerate(sending):
+		table[cell, :len(cells)] = cells
+	return table
+
+class Batch:
+
+	def __init__(self, number, (columns, rows), players, topology=None):
+		"""Makes number empty boards of the given size. players is the list
+		of players and topology the boards' shape, as for Board."""
+		self.number = number
+		self.columns = columns
+		self.rows = rows
+		self.size = columns * rows
+		self.players = list(players)
+		if topology is None:
+			topology = shapes.topology('rectangle', (columns, rows))
+		self.topology = topology
+		self.counts = numpy.zeros((number, self.size), numpy.int32)
+		self.owners = numpy.empty((number, self.size), numpy.int8)
+		self.owners.fill(NOBODY)
+		# The same limits as Board: the number of neighbours, with holes 0
+		self.limits = numpy.array(topology.limits, numpy.int32)
+		self.senders = senders(topology)
+		self.alive = numpy.ones((number, len(self.players)), bool)
+		self.current = numpy.zeros(number, numpy.int32)
+		self.turns = numpy.zeros(number, numpy.int32)
+		self.boards = numpy.arange(number)		# For picking one cell from each board
+
+	def legal(self):
+		"""Gives a (N, cells) mask of the cells each board's current player
+		may add to."""
+		return ((self.owners == NOBODY) & (self.limits > 0)) | (self.owners == self.current[:, None])
+
+	def winners(self):
+		"""Gives each board's winning player, or NOBODY if it is still going."""
+		if len(self.players) < 2:
+			return numpy.zeros(self.number, numpy.int32) + NOBODY
+		alive = self.alive.sum(1)
+		return numpy.where(alive == 1, self.alive.argmax(1), NOBODY)
+
+	def random_moves(self, generator):
+		"""Gives a random legal Board cell number for every board, using the
+		NumPy RandomState generator."""
+		scores = generator.random_sample(self.counts.shape) * self.legal()
+		return scores.argmax(1)
+
+	def move(self, cells, playing=None, max_explosions=None):
+		"""Each board's current player adds a particle to its Board cell number
+		in cells, then every chain reaction is followed until all the boards
+		are stable (or one player owns a whole board, or max_explosions cells
+		have exploded, as for Board.resolve). Boards which have been won, aren't in the playing mask or whose
+		move is illegal are left alone. Returns a mask of the boards which
+		moved and how many waves each took."""
+		cells = numpy.asarray(cells)
+		moved = self.legal()[self.boards, cells] & (self.winners() == NOBODY)
+		if playing is not None:
+			moved &= playing
+		boards = self.boards[moved]
+		self.counts[boards, cells[moved]] += 1
+		self.owners[boards, cells[moved]] = self.current[moved]
+		# Only the cell played on can start a reaction
+		touched = numpy.zeros(self.counts.shape, bool)
+		touched[boards, cells[moved]] = True
+		waves = self.resolve(moved, touched, max_explosions)
+		self.turns[moved] += 1
+		self.check_players(moved)
+		self.next_player(moved)
+		return moved, waves
+
+	def resolve(self, active, touched, max_explosions=None):
+		"""Explode every critical cell on the active boards, wave by wave.
+		Like Board.resolve, only cells in the touched mask (the cell played on
+		at first, then each wave's cells and their neighbours) can explode.
+		Returns how many waves each board took."""
+		if max_explosions is None:
+			max_explosions = explosion_limit((self.columns, self.rows))
+		active = active.copy()
+		waves = numpy.zeros(self.number, numpy.int32)
+		explosions = numpy.zeros(self.number, numpy.int64)
+		mover = self.current[:, None]
+		# Boards where a reaction would go on forever without anyone winning
+		# aren't followed at all, as on a Board
+		alive = self.alive.sum(1)
+		endless = self.counts.sum(1) > self.topology.capacity
+		active &= ~(endless & ~((alive >= 2) & (self.turns >= alive - 1)))
+		# Holes hold nothing, but their limit of 0 would make them critical
+		playable = self.limits > 0
+		sent = numpy.zeros((self.number, self.size + 1), numpy.int32)		# With the padding cell
+		while True:
+			critical = (self.counts >= self.limits) & playable & touched & active[:, None]
+			active &= critical.any(1)
+			# Boards which have had too many explosions stop, as on a Board
+			active &= explosions < max_explosions
+			critical &= active[:, None]
+			if not active.any():
+				break
+			waves += active
+			explosions += critical.sum(1)
+			self.counts -= critical * self.limits
+			self.owners[critical & (self.counts == 0)] = NOBODY
+			# Each exploding cell sends one particle to each neighbour
+			sent[:, :-1] = critical
+			incoming = numpy.zeros(self.counts.shape, numpy.int32)
+			for column in xrange(self.senders.shape[1]):
+				incoming += sent[:, self.senders[:, column]]
+			self.counts += incoming
+			receiving = incoming > 0
+			self.owners = numpy.where(receiving, mover, self.owners).astype(numpy.int8)
+			touched = critical | receiving
+			# Stop boards where one player has taken everything, once everyone
+			# has had their first move, just as Board.owns_everything does
+			alive = self.alive.sum(1)
+			others = ((self.owners != mover) & (self.owners != NOBODY)).any(1)
+			active &= ~((alive >= 2) & (self.turns >= alive - 1) & ~others)
+		return waves
+
+	def play(self, generator, max_moves):
+		"""Play random legal moves on every board until they have all been
+		won, or max_moves moves have been made. Returns how many moves each
+		board made."""
+		moves = numpy.zeros(self.number, numpy.int32)
+		for move in xrange(max_moves):
+			playing = self.winners() == NOBODY
+			if not playing.any():
+				break
+			moved, waves = self.move(self.random_moves(generator), playing)
+			moves += moved
+		return moves
+
+	def check_players(self, moved):
+		"""Knock out anyone left without a cell, once every player still in
+		has had a turn."""
+		checking = moved & (self.turns > self.alive.sum(1))
+		for player in range(len(self.players)):
+			owns = (self.owners == player).any(1)
+			self.alive[checking, player] &= owns[checking]
+
+	def next_player(self, moved):
+		"""Pass the turn on to the next player still in, on the boards which
+		moved."""
+		found = numpy.zeros(self.number, bool)
+		following = self.current.copy()
+		for step in range(1, len(self.players) + 1):
+			candidate = (self.current + step) % len(self.players)
+			usable = self.alive[self.boards, candidate] & ~found
+			following[usable] = candidate[usable]
+			found |= usable
+		self.current = numpy.where(moved, following, self.current).astype(numpy.int32)
+
+	def board(self, number):
+		"""Gives board number as a Board."""
+		board = Board((self.columns, self.rows), self.players, self.topology)
+		board.counts = array('H', self.counts[number].tolist())
+		board.owners = array('b', self.owners[number].tolist())
+		board.alive = [player for player in range(len(self.players)) if self.alive[number, player]]
+		board.current = int(self.current[number])
+		board.turns = int(self.turns[number])
+		board.recount()
+		return board
+
+	def set_board(self, number, board):
+		"""Copy a Board (of the same size, shape and players) into board
+		number."""
+		self.counts[number] = board.counts
+		self.owners[number] = board.owners
+		self.alive[number] = False
+		self.alive[number, board.alive] = True
+		self.current[number] = board.current
+		self.turns[number] = board.turns
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+# This times the parts of Gnucleon which get slow on big boards, without
+# needing a display, and prints the results as JSON so that runs from
+# different commits can be compared. Everything random is seeded, so the same
+# commit always plays the same games. Run with --help to see the options
+import json
+import optparse
+import platform
+import random
+import resource
+import subprocess
+import sys
+from board import Board, parse_sizes
+from profiler import clock
+
+def peak_memory():
+	"""Gives the most memory we have used so far, in kilobytes."""
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def commit():
+	"""Gives the git commit we are running, or None if we can't tell."""
+	try:
+		return subprocess.Popen(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()[0].strip() or None
+	except OSError:
+		return None
+
+def construction(sizes, players, repeats):
+	"""Times making an empty Board of each size."""
+	results = []
+	for columns, rows in sizes:
+		start = clock()
+		for repeat in range(repeats):
+			Board((columns, rows), players)
+		results.append({'columns':columns, 'rows':rows,
+		                'seconds':(clock() - start) / repeats})
+	return results
+
+def grid_construction(sizes, players):
+	"""Times making a Grid of each size. This needs Clutter and a display."""
+	import gnucleon
+	gnucleon.colours = list(players)
+	results = []
+	for columns, rows in sizes:
+		start = clock()
+		gnucleon.Grid((800, 600), (columns, rows))
+		results.append({'columns':columns, 'rows':rows, 'seconds':clock() - start})
+	return results
+
+def frame_cost(sizes, players, moves, seed):
+	"""Times every frame of showing moves seeded random moves on a Grid of
+	each size. The animations run off a VirtualClock, so every run steps
+	through exactly the same frames as fast as they can be worked out. This
+	needs Clutter, but the stage isn't shown so drawing isn't included."""
+	import gnucleon
+	from clocks import VirtualClock
+	gnucleon.colours = list(players)
+	gnucleon.bots = {}
+	results = []
+	for columns, rows in sizes:
+		gnucleon.ticker = VirtualClock()
+		gnucleon.start_electrons()
+		gnucleon.current_colour = players[0]
+		grid = gnucleon.Grid((800, 600), (columns, rows))
+		generator = random.Random(seed)
+		times = []
+		played = 0
+		while grid.board.winner() is None and played < moves:
+			played += 1
+			grid.move(grid.board.position(generator.choice(grid.board.legal_moves())))
+			# Step until the move and its explosions have been shown
+			while not gnucleon.ticker.idle():
+				start = clock()
+				gnucleon.ticker.step()
+				times.append(clock() - start)
+		times.sort()
+		seconds = sum(times)
+		results.append({'columns':columns, 'rows':rows, 'moves':played, 'frames':len(times),
+		                'seconds':seconds, 'frames_per_second':len(times) / seconds,
+		                'mean_ms':1000 * seconds / len(times),
+		                'median_ms':1000 * times[len(times) / 2],
+		                'worst_ms':1000 * times[-1]})
+	return results
+
+def play(board, generator, max_moves):
+	"""Play random legal moves until somebody wins. Returns how many moves
+	were played."""
+	moves = 0
+	while board.winner() is None and moves < max_moves:
+		board.move(generator.choice(board.legal_moves()))
+		moves += 1
+	return moves
+
+def throughput(sizes, players, games, seed):
+	"""Times whole games of random moves on each size of board."""
+	results = []
+	for columns, rows in sizes:
+		generator = random.Random(seed)
+		moves = 0
+		start = clock()
+		for game in range(games):
+			moves += play(Board((columns, rows), players), generator, 20 * columns * rows)
+		seconds = clock() - start
+		results.append({'columns':columns, 'rows':rows, 'games':games,
+		                'moves':moves, 'seconds':seconds,
+		                'moves_per_second':moves / seconds})
+	return results
+
+def batch_throughput(sizes, players, games, seed):
+	"""Times the same number of random games as throughput, all played at
+	once by a Batch. This needs NumPy."""
+	import numpy
+	from batch import Batch
+	results = []
+	for columns, rows in sizes:
+		generator = numpy.random.RandomState(seed)
+		start = clock()
+		moves = int(Batch(games, (columns, rows), players).play(generator, 20 * columns * rows).sum())
+		seconds = clock() - start
+		results.append({'columns':columns, 'rows':rows, 'games':games,
+		                'moves':moves, 'seconds':seconds,
+		                'moves_per_second':moves / seconds})
+	return results
+
+def random_board(size, players, generator):
+	"""Gives a Board with every cell holding a random number of particles
+	(never enough to explode) belonging to a random player."""
+	columns, rows = size
+	board = Board((columns, rows), players)
+	for cell in xrange(board.size):
+		board.set_cell(cell, generator.randrange(len(players)), generator.randrange(board.limits[cell]))
+	# Everyone has had their first move
+	board.turns = len(players)
+	return board
+
+def adversarial_board(size, players):
+	"""Gives the worst Board we know of. Every cell is one short of
+	exploding, all belonging to the last player, apart from a corner which
+	belongs to the first player. Adding to that corner sets off every cell."""
+	columns, rows = size
+	board = Board((columns, rows), players)
+	for cell in xrange(board.size):
+		board.set_cell(cell, len(players) - 1, board.limits[cell] - 1)
+	board.set_cell(0, 0, board.limits[0] - 1)
+	board.turns = len(players)
+	return board
+
+def time_reaction(board, cell):
+	"""Times one move at cell and describes the chain reaction it caused."""
+	start = clock()
+	reaction = board.move(cell)
+	seconds = clock() - start
+	return {'columns':board.columns, 'rows':board.rows, 'seconds':seconds,
+	        'waves':len(reaction.waves), 'explosions':len(reaction.exploded()),
+	        'reason':reaction.reason}
+
+def reactions(sizes, players, tries, seed):
+	"""Finds the slowest chain reaction from tries random moves on a random
+	Board of each size, and times the adversarial Board of each size."""
+	results = []
+	for size in sizes:
+		generator = random.Random(seed)
+		worst = None
+		for attempt in range(tries):
+			board = random_board(size, players, generator)
+			timing = time_reaction(board, generator.choice(board.legal_moves()))
+			if worst is None or timing['seconds'] > worst['seconds']:
+				worst = timing
+		worst['board'] = 'random'
+		results.append(worst)
+		timing = time_reaction(adversarial_board(size, players), 0)
+		timing['board'] = 'adversarial'
+		results.append(timing)
+	return results
+
+def main(arguments):
+	parser = optparse.OptionParser(usage='%prog [options]')
+	parser.add_option('--sizes', default='8x6,16x16,32x32,64x64,128x128,256x256',
+	                  help='board sizes for construction and chain reactions [%default]')
+	parser.add_option('--game-sizes', default='8x6,16x16',
+	                  help='board sizes to play whole games on [%default]')
+	parser.add_option('--players', type='int', default=2, help='number of players [%default]')
+	parser.add_option('--games', type='int', default=20, help='games per size [%default]')
+	parser.add_option('--tries', type='int', default=10, help='random chain reactions per size [%default]')
+	parser.add_option('--repeats', type='int', default=3, help='constructions per size [%default]')
+	parser.add_option('--seed', type='int', default=0, help='random seed [%default]')
+	parser.add_option('--grid', action='store_true', default=False,
+	                  help='also time building Grids (needs a display)')
+	parser.add_option('--frames', type='int', metavar='MOVES',
+	                  help='also time each frame of showing this many moves on each game size (needs Clutter)')
+	parser.add_option('--batch', action='store_true', default=False,
+	                  help='also time playing the games all at once with NumPy')
+	parser.add_option('-o', '--output', help='write the JSON here instead of to stdout')
+	options, rest = parser.parse_args(arguments)
+	sizes = parse_sizes(options.sizes)
+	game_sizes = parse_sizes(options.game_sizes)
+	players = ['player%d' % player for player in range(options.players)]
+
+	results = {'commit':commit(), 'python':platform.python_version(),
+	           'seed':options.seed, 'players':options.players}
+	results['construction'] = construction(sizes, players, options.repeats)
+	if options.grid:
+		results['grid_construction'] = grid_construction(sizes, players)
+	if options.frames:
+		results['frame_cost'] = frame_cost(game_sizes, players, options.frames, options.seed)
+	results['throughput'] = throughput(game_sizes, players, options.games, options.seed)
+	if options.batch:
+		results['batch_throughput'] = batch_throughput(game_sizes, players, options.games, options.seed)
+	results['reactions'] = reactions(sizes, players, options.tries, options.seed)
+	results['peak_memory_kb'] = peak_memory()
+
+	if options.output:
+		output = open(options.output, 'w')
+	else:
+		output = sys.stdout
+	json.dump(results, output, indent=1, sort_keys=True)
+	output.write('\n')
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+
+# This is the game itself, without any of the graphics. Keeping it apart from
+# Clutter means it can be played without a display, for example by bots or
+# when analysing games, and millions of moves don't create millions of actors.
+# Everything is stored in flat arrays indexed by cell number, where the cell at
+# (column, row) is number column * rows + row, ie. the same order as the
+# columns of squares in Grid.grid
+import binascii
+import copy
+import random
+import sys
+from array import array
+import topology as shapes
+
+# This is stored as the owner of a cell which nobody owns
+NOBODY = -1
+
+# How many explosions we will follow for one move, for each cell on the board
+# and each of its columns and rows. Once every cell is near its limit a
+# reaction can go on forever, so we have to stop. Counting explosions rather
+# than waves keeps the work bounded however many cells each wave sets off. A
+# reaction which does finish sets off each cell more often the further it has
+# to spread: taking over a full board explodes every cell up to a quarter as
+# many times as the board has columns and rows, so this leaves room for that
+EXPLOSIONS_PER_LINE = 1
+
+def explosion_limit((columns, rows)):
+	"""Gives the most explosions we will follow for one move on a board of
+	the given size."""
+	return EXPLOSIONS_PER_LINE * columns * rows * (columns + rows)
+
+# These say why a chain reaction stopped
+STABLE = 'stable'		# Nothing left to explode
+TAKEOVER = 'takeover'		# One player owns the whole board
+CAPPED = 'capped'		# We gave up after too many explosions
+
+# Zobrist multipliers are made for counts below this. Cells only go over it in
+# the middle of a chain reaction (or after one was CAPPED)
+KEYED_COUNTS = 8
+
+# Everything the hashes are kept to
+MASK = 0xFFFFFFFFFFFFFFFF
+
+def random_keys(generator, number):
+	"""Gives number random 64 bit keys from generator. They are kept in an
+	array of unsigned longs where those are 64 bits, which takes an eighth of
+	the memory of a list of Python longs, and in a list otherwise (eg. on
+	Windows). Either way the same generator gives the same keys."""
+	# Making keys a few hundred at a time is far faster than asking for each
+	# one, and doesn't need huge numbers
+	digits = []
+	for start in xrange(0, number, 512):
+		count = min(512, number - start)
+		digits.append('%0*x' % (16 * count, generator.getrandbits(64 * count)))
+	digits = ''.join(digits)
+	if array('L').itemsize != 8:
+		return [int(digits[start:start + 16], 16) for start in xrange(0, len(digits), 16)]
+	keys = array('L', binascii.unhexlify(digits))
+	if sys.byteorder == 'little':
+		# The digits are written most significant first
+		keys.byteswap()
+	return keys
+
+class Zobrist:
+	# Zobrist hashing gives every (cell, owner, count) a random number. The
+	# hash of a position is all of those for its cells, and a number for whose
+	# turn it is, XORed together. When a cell changes we XOR out its old number
+	# and XOR in the new one, so the hash is kept up to date as we go. Rather
+	# than storing a number for every count, each (cell, owner) has a random
+	# number which is multiplied by a random odd number for the count, so a
+	# big board's keys take an eighth of the memory and time to make
+
+	def __init__(self, size, players, seed=0):
+		"""size is the number of cells, players how many players there are.
+		The same seed always gives the same keys, so hashes can be compared
+		between processes."""
+		generator = random.Random(seed)
+		self.players = players
+		self.cell_keys = random_keys(generator, size * players)
+		# Odd, so that multiplying by them never loses any bits
+		self.count_keys = [key | 1 for key in random_keys(generator, KEYED_COUNTS)]
+		self.turn_keys = random_keys(generator, players)
+
+	def key(self, cell, owner, count):
+		"""Gives the number for cell holding count particles owned by owner."""
+		if count == 0:
+			# Empty cells don't change the hash
+			return 0
+		if count < KEYED_COUNTS:
+			return (self.cell_keys[cell * self.players + owner] * self.count_keys[count]) & MASK
+		# Very full cells are rare, so make up a multiplier from the count
+		return (self.cell_keys[cell * self.players + owner] * ((count * 0x9E3779B97F4A7C15) | 1)) & MASK
+
+# Boards of the same size share their keys, since making them is slow
+zobrist_keys = {}
+
+def zobrist(size, players):
+	"""Gives the Zobrist keys for size cells and the given number of players."""
+	if (size, players) not in zobrist_keys:
+		zobrist_keys[(size, players)] = Zobrist(size, players)
+	return zobrist_keys[(size, players)]
+
+class Reaction:
+	# A Reaction is what happened after a particle was added: every cell which
+	# exploded, generation by generation, and why it stopped. The cells in a
+	# wave all explode at the same time, so the Grid can animate them together
+
+	def __init__(self, waves, reason):
+		self.waves = waves		# A list of lists of cells
+		self.reason = reason		# STABLE, TAKEOVER or CAPPED
+
+	def exploded(self):
+		"""Gives every cell which exploded, in order."""
+		return [cell for wave in self.waves for cell in wave]
+
+class Board:
+	# A Board keeps track of how many particles each cell holds, who owns each
+	# cell and how many particles each cell can hold before it explodes.
+	# Players are referred to by their position in the players list
+
+	def __init__(self, (columns, rows), players, topology=None):
+		"""columns and rows give the size of the board. players is a list of
+		the players (eg. colours) in the order they take their turns.
+		topology gives the board's shape, a rectangle if it isn't given."""
+		self.columns = columns
+		self.rows = rows
+		self.size = columns * rows		# The number of cells
+		self.players = list(players)
+		# These are the actual contents of the board
+		self.counts = array('H', [0]) * self.size		# Particles in each cell
+		self.owners = array('b', [NOBODY]) * self.size		# Who owns each cell
+		# A cell explodes once it holds as many particles as it has neighbours,
+		# so on a rectangle corners hold 2, edges 3 and everything else 4.
+		# The Topology works these out once and every Board shares them
+		if topology is None:
+			topology = shapes.topology('rectangle', (columns, rows))
+		self.topology = topology
+		self.limits = topology.limits
+		self.lists = topology.lists
+		# Running totals, kept up to date as particles move so that we never
+		# have to look over the whole board to find out who is still in
+		self.cells = array('l', [0]) * len(self.players)		# Cells each player owns
+		self.particles = array('l', [0]) * len(self.players)		# Particles each player has
+		self.occupied = 0		# Cells anybody owns
+		# The players still in the game, in turn order
+		self.alive = range(len(self.players))
+		# The player whose turn it is
+		self.current = 0
+		# This identifies the position, and is kept up to date as it changes
+		self.zobrist = zobrist(self.size, len(self.players))
+		self.hash = self.zobrist.turn_keys[self.current]
+		# This stores the number of turns taken, since declaring a player
+		# dead is not fair if they have yet to make their first move!
+		self.turns = 0
+
+	def index(self, (column, row)):
+		"""Gives the cell number of the given column and row."""
+		return column * self.rows + row
+
+	def position(self, cell):
+		"""Gives the (column, row) of the given cell number."""
+		return divmod(cell, self.rows)
+
+	def neighbours(self, cell):
+		"""Gives the cells next to the given cell, eg. up, down, left, right
+		on a rectangle (leaving out any which are off the board). This must not
+		be changed."""
+		return self.lists[cell]
+
+	def legal(self, cell, player=None):
+		"""A move is legal if the cell is empty or already belongs to the
+		player, and isn't a hole. If no player is given then the current player
+		is used."""
+		if player is None:
+			player = self.current
+		return (self.owners[cell] == NOBODY and self.limits[cell] > 0) or self.owners[cell] == player
+
+	def legal_moves(self, player=None):
+		"""Gives a list of every cell the player may add a particle to."""
+		if player is None:
+			player = self.current
+		return [cell for cell in xrange(self.size) if self.legal(cell, player)]
+
+	def add(self, cell, player):
+		"""Put a particle in the given cell, which becomes owned by player."""
+		owner = self.owners[cell]
+		self.hash ^= self.zobrist.key(cell, owner, self.counts[cell]) ^ self.zobrist.key(cell, player, self.counts[cell] + 1)
+		if owner != player:
+			# Everything already in the cell changes hands
+			if owner == NOBODY:
+				self.occupied += 1
+			else:
+				self.cells[owner] -= 1
+				self.particles[owner] -= self.counts[cell]
+			self.cells[player] += 1
+			self.particles[player] += self.counts[cell]
+			self.owners[cell] = player
+		self.counts[cell] += 1
+		self.particles[player] += 1
+
+	def explode(self, cell, player):
+		"""Send one particle from the cell to each of its neighbours. They all
+		end up belonging to player."""
+		neighbours = self.lists[cell]
+		owner = self.owners[cell]
+		self.hash ^= self.zobrist.key(cell, owner, self.counts[cell]) ^ self.zobrist.key(cell, owner, self.counts[cell] - len(neighbours))
+		self.counts[cell] -= len(neighbours)
+		self.particles[owner] -= len(neighbours)
+		if self.counts[cell] == 0:
+			# Nothing left behind, so the cell has no owner
+			self.owners[cell] = NOBODY
+			self.cells[owner] -= 1
+			self.occupied -= 1
+		for neighbour in neighbours:
+			self.add(neighbour, player)
+
+	def set_cell(self, cell, owner, count):
+		"""Put count particles belonging to owner in cell, whatever was there
+		before. This is for setting up positions rather than playing them, and
+		keeps the totals and hash up to date."""
+		if self.counts[cell]:
+			self.cells[self.owners[cell]] -= 1
+			self.particles[self.owners[cell]] -= self.counts[cell]
+			self.occupied -= 1
+		self.hash ^= self.zobrist.key(cell, self.owners[cell], self.counts[cell])
+		if count == 0:
+			owner = NOBODY
+		self.counts[cell] = count
+		self.owners[cell] = owner
+		self.hash ^= self.zobrist.key(cell, owner, count)
+		if count:
+			self.cells[owner] += 1
+			self.particles[owner] += count
+			self.occupied += 1
+
+	def critical(self, cell):
+		"""Whether the cell holds enough particles to explode."""
+		return self.counts[cell] >= self.limits[cell]
+
+	def resolve(self, cell, player, max_explosions=None):
+		"""Follow the chain reaction started at cell, with everything caught
+		up in it going to player. Every critical cell explodes at once, then
+		we look at the cells they sent particles to (and themselves, in case
+		they are still over their limit) to find the next wave. This never
+		recurses, and doesn't start another wave once max_explosions cells
+		have exploded (explosion_limit of our size if it isn't given), even if
+		the board is still critical. A reaction which could never settle, and
+		can't be won by a takeover, isn't followed at all. Returns a
+		Reaction."""
+		if max_explosions is None:
+			max_explosions = explosion_limit((self.columns, self.rows))
+		waves = []
+		explosions = 0
+		wave = [cell] if self.critical(cell) else []
+		if wave and not self.can_take_over() and sum(self.particles) > self.topology.capacity:
+			# This would go on forever without anyone winning, so there is
+			# no point following it up to the limit
+			return Reaction(waves, CAPPED)
+		while wave:
+			if explosions >= max_explosions:
+				return Reaction(waves, CAPPED)
+			explosions += len(wave)
+			waiting = set()
+			for cell in wave:
+				self.explode(cell, player)
+				waiting.add(cell)
+				waiting.update(self.lists[cell])
+			waves.append(wave)
+			if self.owns_everything(player):
+				return Reaction(waves, TAKEOVER)
+			# Sorting keeps the order the same every time
+			wave = sorted(cell for cell in waiting if self.critical(cell))
+		return Reaction(waves, STABLE)
+
+	def region(self, cell, reaction):
+		"""Gives the set of cells a move at cell, which caused reaction, read
+		or changed: the cell itself, everything which exploded and their
+		neighbours."""
+		cells = set([cell])
+		for exploded in reaction.exploded():
+			cells.add(exploded)
+			cells.update(self.lists[exploded])
+		return cells
+
+	def can_take_over(self):
+		"""Whether a chain reaction can end with one player owning the whole
+		board, which needs someone to take over and everyone else to have had
+		a chance to make their first move."""
+		return len(self.alive) >= 2 and self.turns >= len(self.alive) - 1
+
+	def owns_everything(self, player):
+		"""Whether nobody but player has anything left on the board, once
+		everyone else has had a chance to make their first move."""
+		if not self.can_take_over():
+			return False
+		return self.cells[player] == self.occupied
+
+	def move(self, cell):
+		"""Have the current player add a particle to cell, set off any
+		explosions, eliminate anyone taken out and pass the turn on. Returns
+		the Reaction, or None if the move is illegal."""
+		player = self.current
+		if not self.legal(cell, player):
+			return None
+		self.add(cell, player)
+		reaction = self.resolve(cell, player)
+		self.turns += 1
+		self.check_players()
+		self.next_player()
+		return reaction
+
+	def check_players(self):
+		"""Remove any players who no longer own a cell from self.alive."""
+		# Only check if every player has had at least one turn
+		if self.turns > len(self.alive):
+			self.alive = [player for player in self.alive if self.cells[player]]
+
+	def next_player(self):
+		"""Pass the turn on to the next player still in the game."""
+		# The player who just moved always owns something, so is still alive
+		place = self.alive.index(self.current)
+		self.hash ^= self.zobrist.turn_keys[self.current]
+		self.current = self.alive[(place + 1) % len(self.alive)]
+		self.hash ^= self.zobrist.turn_keys[self.current]
+
+	def scores(self):
+		"""Gives a list of (player, cells owned, particles) for every player
+		still in the game, in turn order."""
+		return [(player, self.cells[player], self.particles[player]) for player in self.alive]
+
+	def winner(self):
+		"""Gives the winning player, or None if the game is still going (or
+		only ever had one player)."""
+		if len(self.players) > 1 and len(self.alive) == 1:
+			return self.alive[0]
+		return None
+
+	def recount(self):
+		"""Work out the running totals and hash from scratch, eg. after the
+		counts and owners have been loaded from somewhere."""
+		self.cells = array('l', [0]) * len(self.players)
+		self.particles = array('l', [0]) * len(self.players)
+		self.occupied = 0
+		for cell in xrange(self.size):
+			if self.counts[cell]:
+				self.cells[self.owners[cell]] += 1
+				self.particles[self.owners[cell]] += self.counts[cell]
+				self.occupied += 1
+		self.rehash()
+
+	def rehash(self):
+		"""Work out self.hash from scratch, eg. after changing the arrays
+		directly."""
+		self.hash = self.zobrist.turn_keys[self.current]
+		for cell in xrange(self.size):
+			self.hash ^= self.zobrist.key(cell, self.owners[cell], self.counts[cell])
+		return self.hash
+
+	def copy(self):
+		"""Gives a new Board in the same position, which can be changed
+		without affecting this one."""
+		other = copy.copy(self)
+		other.counts = array('H', self.counts)
+		other.owners = array('b', self.owners)
+		other.cells = array('l', self.cells)
+		other.particles = array('l', self.particles)
+		other.alive = list(self.alive)
+		return other
+
+def parse_sizes(text):
+	"""Turns '8x6,16x16' into [(8, 6), (16, 16)]."""
+	return [tuple(int(number) for number in size.split('x')) for size in text.split(',')]
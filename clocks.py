@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+# Where animations get their time from. A RealClock hands out Clutter's own
+# timelines and alphas, which follow the wall clock, and gobject timeouts. A
+# VirtualClock hands out look-alikes which only move when it is told to step
+# forward a frame, so the same run always shows the same frames whatever the
+# machine is doing. It can be stepped by hand (eg. thousands of frames a second
+# in a benchmark, with no display), or attached to the main loop to run at
+# real speed or faster. Behaviours are hooked up with drive rather than
+# set_alpha so that they work with either
+import math
+import clutter
+import gobject
+
+# The shapes of alpha the game uses, as Clutter's functions and as functions
+# of how far through the timeline we are (from 0.0 to 1.0)
+SHAPES = ['ramp', 'sine', 'sine_inc']
+
+def clutter_function(shape):
+	"""Gives Clutter's alpha function for the named shape."""
+	return {'ramp':clutter.ramp_inc_func, 'sine':clutter.sine_func, 'sine_inc':clutter.sine_inc_func}[shape]
+
+def progress_function(shape):
+	"""Gives a function from progress to the named shape, both 0.0 to 1.0."""
+	return {'ramp':lambda progress: progress,
+	        'sine':lambda progress: math.sin(math.pi * progress),		# Up and back down
+	        'sine_inc':lambda progress: math.sin(math.pi / 2 * progress)}[shape]
+
+class RealClock:
+	# Animations run off the wall clock, through Clutter
+
+	def timeline(self, fps, duration):
+		"""Gives a timeline of duration milliseconds."""
+		return clutter.Timeline(fps=fps, duration=duration)
+
+	def alpha(self, timeline, shape):
+		"""Gives an alpha following timeline with the named shape."""
+		return clutter.Alpha(timeline, clutter_function(shape))
+
+	def drive(self, behaviour, alpha):
+		"""Have alpha drive behaviour."""
+		behaviour.set_alpha(alpha)
+
+	def timeout_add(self, interval, function, *arguments):
+		"""Call function every interval milliseconds until it returns False."""
+		return gobject.timeout_add(interval, function, *arguments)
+
+class VirtualTimeline:
+	# Works like a clutter.Timeline, but its time only passes when its
+	# VirtualClock steps
+
+	def __init__(self, clock, duration):
+		self.clock = clock
+		self.duration = float(duration)
+		self.elapsed = 0.0		# Milliseconds from the start
+		self.loop = False
+		self.direction = clutter.TIMELINE_FORWARD
+		self.playing = False
+		self.alphas = []
+		self.handlers = []		# (function, arguments) to call when completed
+
+	def set_loop(self, loop):
+		self.loop = loop
+
+	def set_direction(self, direction):
+		self.direction = direction
+
+	def get_direction(self):
+		return self.direction
+
+	def is_playing(self):
+		return self.playing
+
+	def connect(self, signal, function, *arguments):
+		"""Only 'completed' is ever used."""
+		self.handlers.append((function, arguments))
+
+	def start(self):
+		if not self.playing:
+			self.playing = True
+			self.clock.timelines.append(self)
+
+	def stop(self):
+		if self.playing:
+			self.playing = False
+			self.clock.timelines.remove(self)
+
+	def rewind(self):
+		"""Go back to the start, which is the end if we are going backwards."""
+		if self.direction == clutter.TIMELINE_FORWARD:
+			self.elapsed = 0.0
+		else:
+			self.elapsed = self.duration
+		self.notify()
+
+	def progress(self):
+		"""Gives how far through we are, from 0.0 to 1.0."""
+		return self.elapsed / self.duration
+
+	def notify(self):
+		"""Tell the alphas, and through them the behaviours, where we are."""
+		for alpha in self.alphas:
+			alpha.notify(self.progress())
+
+	def advance(self, milliseconds):
+		"""Move on by milliseconds, as a frame of the VirtualClock."""
+		if self.direction == clutter.TIMELINE_FORWARD:
+			self.elapsed += milliseconds
+			finished = self.elapsed >= self.duration
+		else:
+			self.elapsed -= milliseconds
+			finished = self.elapsed <= 0
+		if finished and self.loop:
+			self.elapsed %= self.duration
+			finished = False
+		elif finished:
+			self.elapsed = min(max(self.elapsed, 0.0), self.duration)
+		self.notify()
+		if finished:
+			# Like a clutter.Timeline we go back to the start, so starting
+			# again plays the whole thing. The behaviours are left where they
+			# ended until then
+			self.stop()
+			if self.direction == clutter.TIMELINE_FORWARD:
+				self.elapsed = 0.0
+			else:
+				self.elapsed = self.duration
+			for function, arguments in self.handlers:
+				function(self, *arguments)
+
+class VirtualAlpha:
+	# Works like a clutter.Alpha, calling its behaviours itself
+
+	def __init__(self, timeline, shape):
+		self.function = progress_function(shape)
+		self.behaviours = []
+		timeline.alphas.append(self)
+
+	def notify(self, progress):
+		value = int(self.function(progress) * clutter.MAX_ALPHA)
+		for behaviour in self.behaviours:
+			behaviour.do_alpha_notify(value)
+
+class VirtualClock:
+	# Animations and timeouts run off a clock which moves one frame at a time,
+	# each frame being 1000 / fps milliseconds long
+
+	def __init__(self, fps=60):
+		self.fps = fps
+		self.frame_length = 1000.0 / fps
+		self.now = 0.0		# Virtual milliseconds since we started
+		self.frames = 0		# Frames stepped so far
+		self.timelines = []		# The timelines which are playing
+		self.timeouts = []		# [when, order, interval, function, arguments]
+		self.added = 0		# For keeping timeouts due at once in order
+		self.attached = None		# The gobject timeout stepping us, if any
+
+	def timeline(self, fps, duration):
+		"""Gives a timeline of duration virtual milliseconds. Every timeline
+		moves on once per frame of the clock, whatever fps it asks for."""
+		return VirtualTimeline(self, duration)
+
+	def alpha(self, timeline, shape):
+		"""Gives an alpha following timeline with the named shape."""
+		return VirtualAlpha(timeline, shape)
+
+	def drive(self, behaviour, alpha):
+		"""Have alpha drive behaviour."""
+		alpha.behaviours.append(behaviour)
+
+	def timeout_add(self, interval, function, *arguments):
+		"""Call function every interval virtual milliseconds until it returns
+		False."""
+		self.added += 1
+		self.timeouts.append([self.now + interval, self.added, interval, function, arguments])
+		return self.added
+
+	def step(self, frames=1):
+		"""Move on by the given number of frames."""
+		for frame in xrange(frames):
+			self.now += self.frame_length
+			self.frames += 1
+			# Timeouts which are due go first, in the order they are due
+			due = sorted(timeout for timeout in self.timeouts if timeout[0] <= self.now)
+			for timeout in due:
+				when, order, interval, function, arguments = timeout
+				if function(*arguments):
+					timeout[0] = when + interval
+				else:
+					self.timeouts.remove(timeout)
+			for timeline in list(self.timelines):
+				if timeline.playing:
+					timeline.advance(self.frame_length)
+
+	def advance(self, milliseconds):
+		"""Move on by at least the given number of milliseconds, a whole
+		frame at a time."""
+		self.step(int(math.ceil(milliseconds / self.frame_length)))
+
+	def idle(self):
+		"""Whether nothing is waiting to happen, apart from looping timelines
+		(such as the electrons going round)."""
+		return not self.timeouts and not [timeline for timeline in self.timelines if not timeline.loop]
+
+	def settle(self, limit=100000):
+		"""Step until idle, or for at most limit frames. Returns how many
+		frames were stepped."""
+		start = self.frames
+		while not self.idle() and self.frames - start < limit:
+			self.step()
+		return self.frames - start
+
+	def attach(self, speed=1.0):
+		"""Step along with the main loop, speed times as fast as real time,
+		eg. to watch a run which is otherwise the same as a stepped one."""
+		if self.attached is None:
+			interval = max(1, int(self.frame_length / speed))
+			self.attached = gobject.timeout_add(interval, self.attached_step)
+
+	def attached_step(self):
+		self.step()
+		return True
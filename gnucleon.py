@@ -1,36 +1,33 @@
 #!/usr/bin/env python
 
+# The frozen version runs on Python 2.5, which needs this for 'with' blocks
+from __future__ import with_statement
 import gc
 import math
+import optparse
+import os
 import clutter
 import gtk
 import cairo
 import cluttercairo
-
-class BehaviourSpin(clutter.Behaviour):
-	# This is a simple Clutter behaviour which spins any actor it is applied to
-	__gtype_name__ = 'BehaviourSpin'
-
-	def __init__(self, alpha):
-		clutter.Behaviour.__init__(self)
-		self.set_alpha(alpha)
-		# The start and end angles can be changed to suit the desired rotation
-		self.angle_start = 359.0
-		self.angle_end = 0.0
-
-	def do_alpha_notify (self, alpha_value):
-		# This is run when Clutter updates. alpha_value is the progress of the
-		# behaviour, running from 0 to clutter.MAX_ALPHA, therefore alpha_value
-		# divided by clutter.MAX_ALPHA gives progress from 0.0 to 1.0
-		angle = alpha_value \
-			* (self.angle_end - self.angle_start) \
-			/ clutter.MAX_ALPHA
-		# Apply the new angle to any actors we have been applied to
-		for actor in self.get_actors():
-			actor.set_rotation(clutter.Z_AXIS, angle,
-				0,
-				0,
-				0)
+import gobject
+from array import array
+from board import Board, CAPPED
+from profiler import Profiler, clock
+from record import RecordWriter
+from snapshot import SnapshotStore, SnapshotWriter, SnapshotError
+from preview import OutcomeCache
+from history import History
+import render
+from render import Renderer, particle_sizes
+import topology
+import ai
+from clocks import RealClock, VirtualClock
+# NumPy makes moving the electrons faster, but we can do without it
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
 class BehaviourGrow(clutter.Behaviour):
 	# This is a simple Clutter behaviour which changes the size of actors it is
@@ -39,16 +36,17 @@ class BehaviourGrow(clutter.Behaviour):
 
 	def __init__(self, alpha):
 		clutter.Behaviour.__init__(self)
-		self.set_alpha(alpha)
+		ticker.drive(self, alpha)
 
 	def do_alpha_notify(self, alpha_value):
 		# This is run when Clutter updates. alpha_value is the progress of the
 		# behaviour, running from 0 to clutter.MAX_ALPHA, therefore alpha_value
 		# divided by clutter.MAX_ALPHA gives progress from 0.0 to 1.0
-		scale = (alpha_value + 0.0) / (clutter.MAX_ALPHA + 0.0)		# 0.0 is added to make the numbers floats as int/int would equal 0
-		for actor in self.get_actors():
-			# Apply the new scale to any actors we have been applied to
-			actor.set_scale(scale, scale)
+		with profiler.section('BehaviourGrow'):
+			scale = (alpha_value + 0.0) / (clutter.MAX_ALPHA + 0.0)		# 0.0 is added to make the numbers floats as int/int would equal 0
+			for actor in self.get_actors():
+				# Apply the new scale to any actors we have been applied to
+				actor.set_scale(scale, scale)
 
 class BehaviourFade(clutter.Behaviour):
 	# This is a simple Clutter behaviour which changes the opacity of actors it
@@ -57,97 +55,462 @@ class BehaviourFade(clutter.Behaviour):
 
 	def __init__(self, alpha):
 		clutter.Behaviour.__init__(self)
-		self.set_alpha(alpha)
+		ticker.drive(self, alpha)
 
 	def do_alpha_notify(self, alpha_value):
 		# This is run when Clutter updates. alpha_value is the progress of the
 		# behaviour, running from 0 to clutter.MAX_ALPHA, therefore alpha_value
 		# divided by clutter.MAX_ALPHA gives progress from 0.0 to 1.0
-		opacity = (alpha_value + 0.0) / (clutter.MAX_ALPHA + 0.0)		# 0.0 is added to make the numbers floats as int/int would equal 0
-		for actor in self.get_actors():
-			# Apply the new opacity to any actors we have been applied to
-			actor.set_opacity(255 * opacity)		# Opacity goes from 0-255
-
-class BehaviourOrbit(clutter.Behaviour):
-	# This is a more complex Clutter behaviour which works out the trigonometry needed to
-	# send any actors it is applied to around an elliptical path. This behaviour does not
-	# spin the actors as they move around. It does change their scale to appear as if the
-	# actors are moving forwards and backwards in space, and changes their stacking to
-	# ensure that actors in the 'back' of their orbit are drawn behind everything else
-	__gtype_name__ = 'BehaviourOrbit'
-
-	def __init__(self, alpha, width, height, tilt, (offset_x, offset_y), start_angle = 0):
-		"""width is the width of the elliptical path, height is the height. Tilt specifies
-		how many degrees the ellipse is from being straight (ie. width and height are turned
-		away from the screen coordinate system by tilt). Offset x and y give the position of
-		the centre of the ellipse (in the coordinate system the actor is in). Start angle is the
-		angular displacemrnt around the ellipse at the start."""
-		clutter.Behaviour.__init__(self)		# Call the superclass constructor
-		self.set_alpha(alpha)		# Set the tick of the animation
-		self.angle_start = start_angle		# Where abouts on the ellipse we start
-		self.angle_end = start_angle - 359.0		# Where abouts on the ellipse we are aiming for
-		self.angle = self.angle_start		# This stores the angle traversed around the ellipse
-		self.width = width		# The width of the ellipse
-		self.height = height		# The height of the ellipse
-		self.tilt = tilt		# The angle in degrees to tilt the ellipse anticlockwise
-		self.offset = (offset_x, offset_y)		# Where the centre of the ellipse should be
-		self.phase = 0.0		# Initialise this to zero for comparisons later
-
-	def x_position(self, angle):
-		"""Calculates the horizontal position on the screen at a given angle around the ellipse"""
-		# This is a standard mathematical description of a tilted ellipse
-		return self.width * math.cos(math.radians(angle)) * math.cos(math.radians(self.tilt)) - self.height * math.sin(math.radians(angle)) * math.sin(math.radians(self.tilt)) + self.offset[0]
-
-	def y_position(self, angle):
-		"""Calculates the vertical position on the screen at a given angle around the ellipse"""
-		# This is a standard mathematical description of a tilted ellipse
-		return self.width * math.cos(math.radians(angle)) * math.sin(math.radians(self.tilt)) + self.height * math.sin(math.radians(angle)) * math.cos(math.radians(self.tilt)) + self.offset[1]
-
-	def do_alpha_notify (self, alpha_value):
+		with profiler.section('BehaviourFade'):
+			opacity = (alpha_value + 0.0) / (clutter.MAX_ALPHA + 0.0)		# 0.0 is added to make the numbers floats as int/int would equal 0
+			for actor in self.get_actors():
+				# Apply the new opacity to any actors we have been applied to
+				actor.set_opacity(255 * opacity)		# Opacity goes from 0-255
+
+class BehaviourGlide(clutter.Behaviour):
+	# This is a simple Clutter behaviour which moves any actor it is applied to
+	# in a straight line from self.start to self.end
+	__gtype_name__ = 'BehaviourGlide'
+
+	def __init__(self, alpha):
+		clutter.Behaviour.__init__(self)
+		ticker.drive(self, alpha)
+		# These are changed before each glide
+		self.start = (0, 0)
+		self.end = (0, 0)
+
+	def do_alpha_notify(self, alpha_value):
 		# This is run when Clutter updates. alpha_value is the progress of the
 		# behaviour, running from 0 to clutter.MAX_ALPHA, therefore alpha_value
 		# divided by clutter.MAX_ALPHA gives progress from 0.0 to 1.0
-		phase = (alpha_value + 0.0) / (clutter.MAX_ALPHA + 0.0)		# Get a value from 0.0 - 1.0 of our progress
-		delta = self.phase - phase		# Calculate the difference since the last time
-		self.phase = phase		# Update our last known position
-		increment = delta * (((self.angle_end - self.angle_start)))		# Calculate how much angle we should move
-		self.angle += increment		# Add it to the current angle
-
-		# This prevents the values becoming too large by making every turn the first one
-		if self.angle > 360:
-			self.angle -= 360
-		elif self.angle < -360:
-			self.angle += 360
-
-		for actor in self.get_actors():
-			# Update the position and size of actors based on the new angle
+		with profiler.section('BehaviourGlide'):
+			progress = (alpha_value + 0.0) / (clutter.MAX_ALPHA + 0.0)
+			x = self.start[0] + (self.end[0] - self.start[0]) * progress
+			y = self.start[1] + (self.end[1] - self.start[1]) * progress
+			for actor in self.get_actors():
+				actor.set_position(x, y)
+
+class OrbitDriver(clutter.Behaviour):
+	# This moves every electron on the board, sending each one round an
+	# elliptical path while spinning it. The ellipses are tilted, and the
+	# electrons get bigger and smaller as if coming towards us and going away.
+	# Having a behaviour for each electron meant hundreds of Python callbacks,
+	# each working out the same trigonometry, every frame. Since all electrons go
+	# round together (they share electron_alpha) we only need one angle per
+	# frame. Each electron gets a slot in some flat arrays holding the terms of
+	# its ellipse, worked out once when it is registered, so every position
+	# can be found in one pass (using NumPy if it is installed)
+	__gtype_name__ = 'OrbitDriver'
+
+	def __init__(self, alpha, steps=3600):
+		"""steps is how many entries the sine and cosine tables have, ie. how
+		finely the ellipses are divided."""
+		clutter.Behaviour.__init__(self)
+		ticker.drive(self, alpha)
+		# Electrons spin a whole turn, and go a whole way round their
+		# ellipses, once for each trip of the alpha
+		self.angle_start = 0.0
+		self.angle_end = -359.0
+		self.spin_start = 359.0
+		self.spin_end = 0.0
+		self.angle = self.angle_start
+		self.phase = 0.0
+		# Lookup tables for one trip round the ellipse
+		self.steps = steps
+		self.cosines = [math.cos(2 * math.pi * step / steps) for step in range(steps)]
+		self.sines = [math.sin(2 * math.pi * step / steps) for step in range(steps)]
+		# One slot for each electron. An ellipse of width w and height h
+		# tilted by t puts an electron at angle a at
+		#   x = w cos(t) cos(a) - h sin(t) sin(a) + offset x
+		#   y = w sin(t) cos(a) + h cos(t) sin(a) + offset y
+		# so we store the four products of the sizes and the tilt
+		self.slots = []		# The electron in each slot, or None
+		self.free = []		# Slots which have been given up
+		self.x_cos = array('d')
+		self.x_sin = array('d')
+		self.y_cos = array('d')
+		self.y_sin = array('d')
+		self.offset_x = array('d')
+		self.offset_y = array('d')
+		self.factors = array('d')		# Each electron's standard scale
+
+	def register(self, actor, width, height, tilt, (offset_x, offset_y)):
+		"""Send actor around an ellipse width across and height high, tilted
+		tilt degrees anticlockwise, with its centre at offset (in the actor's
+		parent's coordinates). The actor's scale_factor is its standard
+		scale."""
+		terms = (width * math.cos(math.radians(tilt)),
+		         -height * math.sin(math.radians(tilt)),
+		         width * math.sin(math.radians(tilt)),
+		         height * math.cos(math.radians(tilt)),
+		         offset_x, offset_y, actor.scale_factor)
+		columns = (self.x_cos, self.x_sin, self.y_cos, self.y_sin, self.offset_x, self.offset_y, self.factors)
+		if self.free:
+			slot = self.free.pop()
+			self.slots[slot] = actor
+			for column, term in zip(columns, terms):
+				column[slot] = term
+		else:
+			slot = len(self.slots)
+			self.slots.append(actor)
+			for column, term in zip(columns, terms):
+				column.append(term)
+		actor.orbit_slot = slot
+		self.apply(actor)
+
+	def unregister(self, actor):
+		"""Stop moving actor and free up its slot."""
+		self.slots[actor.orbit_slot] = None
+		self.free.append(actor.orbit_slot)
+		self.remove(actor)
+
+	def positions(self, angle):
+		"""Gives lists of the x and y positions of every slot at the given
+		angle in degrees."""
+		step = int(round(angle * self.steps / 360.0)) % self.steps
+		cosine = self.cosines[step]
+		sine = self.sines[step]
+		if numpy is not None:
+			# The arrays are looked at in place, not copied
+			x = numpy.frombuffer(self.x_cos) * cosine + numpy.frombuffer(self.x_sin) * sine + numpy.frombuffer(self.offset_x)
+			y = numpy.frombuffer(self.y_cos) * cosine + numpy.frombuffer(self.y_sin) * sine + numpy.frombuffer(self.offset_y)
+			return x.tolist(), y.tolist()
+		x = [a * cosine + b * sine + c for a, b, c in zip(self.x_cos, self.x_sin, self.offset_x)]
+		y = [a * cosine + b * sine + c for a, b, c in zip(self.y_cos, self.y_sin, self.offset_y)]
+		return x, y
+
+	def do_alpha_notify(self, alpha_value):
+		# This is run when Clutter updates. alpha_value is the progress of the
+		# behaviour, running from 0 to clutter.MAX_ALPHA, therefore alpha_value
+		# divided by clutter.MAX_ALPHA gives progress from 0.0 to 1.0
+		with profiler.section('OrbitDriver'):
+			phase = (alpha_value + 0.0) / (clutter.MAX_ALPHA + 0.0)
+			# Work out how far round we have gone since the last frame, keeping
+			# the angle within one turn so it never gets too large
+			delta = self.phase - phase
+			self.phase = phase
+			self.angle += delta * (self.angle_end - self.angle_start)
+			if self.angle > 360:
+				self.angle -= 360
+			elif self.angle < -360:
+				self.angle += 360
+			# Everything shares the scale and spin, so they are only worked out once
 			scale = math.cos(math.radians((self.angle / 2) - 45))**2 + 0.25
-			actor.set_position(self.x_position(self.angle), self.y_position(self.angle))
-			# Actors must be given a property 'scale_factor' which is their standard scale
-			actor.set_scale(actor.scale_factor * scale, actor.scale_factor * scale)
-			# Adjust the rendering order for things 'in front' or 'behind'
-			#if scale - 0.25 > 0.9:
-			#	actor.raise_top()
-			#elif scale - 0.25 < 0.1:
-			#	actor.lower_bottom()
-
-	def turn(self, angle):
-		"""This tilts the ellipse anticlockwise by the given number of degrees"""
-		self.tilt += angle
-
-	def stretch(self, amount):
-		"""This adds the given number onto the ellipse height"""
-		self.height += amount
+			spin = phase * (self.spin_end - self.spin_start)
+			x, y = self.positions(self.angle)
+			for slot, actor in enumerate(self.slots):
+				if actor is not None:
+					actor.set_position(x[slot], y[slot])
+					actor.set_scale(self.factors[slot] * scale, self.factors[slot] * scale)
+					actor.set_rotation(clutter.Z_AXIS, spin, 0, 0, 0)
+
+# Every timeline, alpha and timeout comes from here. This follows the wall
+# clock, but can be replaced with a VirtualClock (before anything is made) so
+# that frames can be stepped one at a time, eg. by --clock virtual or bench.py
+ticker = RealClock()
+
+def start_electrons():
+	"""Start the timeline which all electrons go round on, and the
+	OrbitDriver which moves them."""
+	# Keep all electrons in sync
+	global electron_alpha
+	electron_timeline = ticker.timeline(50, 1500)
+	electron_timeline.set_loop(True)
+	electron_alpha = ticker.alpha(electron_timeline, 'ramp')
+	electron_timeline.start()
+	# This moves every electron on the board
+	global orbits
+	orbits = OrbitDriver(electron_alpha)
+
+# This times the parts of the game which might make it stutter. It does nothing
+# unless it is enabled, eg. by running with --profile
+profiler = Profiler()
+
+class ImageCache:
+	# Loading an image means reading the file, decoding it and uploading it to
+	# the graphics card, which is far too slow to do for every particle. The
+	# ImageCache does that once for each image and size, then hands out clones
+	# which all draw the same texture. Images are scaled to the size they are
+	# shown at, from a mipmap (the image halved again and again) so that small
+	# sprites are made from a level near their size and stay smooth
+
+	def __init__(self, directory, smallest=4):
+		"""smallest is the size in pixels of the smallest mipmap level."""
+		self.directory = directory		# Where the images live
+		self.smallest = smallest
+		self.pixbufs = {}		# Decoded images, keyed by (name, size)
+		self.textures = {}		# The one real texture for each of those
+		self.mipmaps = {}		# The levels of each image, biggest first
+
+	def load(self, name):
+		"""Decode the image file called name."""
+		with profiler.section('load'):
+			return gtk.gdk.pixbuf_new_from_file(os.path.join(self.directory, name + '.png'))
+
+	def mipmap(self, name):
+		"""Gives the levels of the image called name, biggest first, each half
+		the size of the one before. If there is a '_small' version of a '_big'
+		image it is used as the level of its size, since it was drawn to look
+		good small."""
+		if name not in self.mipmaps:
+			levels = [self.pixbuf(name)]
+			small = None
+			if name.endswith('_big') and os.path.exists(os.path.join(self.directory, name[:-4] + '_small.png')):
+				small = self.load(name[:-4] + '_small')
+			with profiler.section('mipmap'):
+				while min(levels[-1].get_width(), levels[-1].get_height()) / 2 >= self.smallest:
+					level = levels[-1]
+					if small is not None and level.get_width() / 2 <= small.get_width():
+						# Carry on halving from the hand drawn level
+						levels.append(small)
+						small = None
+					else:
+						levels.append(level.scale_simple(level.get_width() / 2, level.get_height() / 2, gtk.gdk.INTERP_BILINEAR))
+			self.mipmaps[name] = levels
+		return self.mipmaps[name]
+
+	def level(self, name, size):
+		"""Gives the smallest level of the image's mipmap which is at least
+		size, as (width, height), so scaling it down loses the least."""
+		levels = self.mipmap(name)
+		for level in reversed(levels):
+			if level.get_width() >= size[0] and level.get_height() >= size[1]:
+				return level
+		return levels[0]
+
+	def pixbuf(self, name, size=None):
+		"""Gives the decoded image called name (eg. 'electron_big'). If size is
+		given as (width, height) then the image is scaled to that size."""
+		key = (name, size)
+		if key not in self.pixbufs:
+			if size is None:
+				self.pixbufs[key] = self.load(name)
+			else:
+				# Scale from the nearest level rather than loading it again
+				level = self.level(name, size)
+				with profiler.section('load'):
+					self.pixbufs[key] = level.scale_simple(size[0], size[1], gtk.gdk.INTERP_BILINEAR)
+		return self.pixbufs[key]
+
+	def texture(self, name, size=None):
+		"""Gives the texture which every clone of this image and size draws.
+		This should not be added to the stage itself."""
+		key = (name, size)
+		if key not in self.textures:
+			pixbuf = self.pixbuf(name, size)
+			with profiler.section('upload'):
+				self.textures[key] = clutter.Texture(pixbuf)
+		return self.textures[key]
+
+	def clone(self, name, size=None):
+		"""Gives a new actor showing the image. It costs no decoding or
+		texture memory since it shares the texture with every other clone."""
+		pixbuf = self.pixbuf(name, size)
+		clone = clutter.CloneTexture(self.texture(name, size))
+		clone.set_size(pixbuf.get_width(), pixbuf.get_height())
+		return clone
+
+# Every image is loaded through this, so each one is only decoded once
+images = ImageCache('images')
+
+class ParticlePool:
+	# Making new actors for every particle, then throwing them away as soon as
+	# the particle moves on, churns through memory. The ParticlePool keeps
+	# hold of actors which aren't being used so that Squares can borrow them
+	# instead. Nucleons are recoloured in place, so one pool does every colour.
+	# Particles are made at the size they are in their Square, and only lent
+	# out at that size. Their images are drawn at the size they end up on
+	# screen, which is different once the Grid is scaled to fit the window
+
+	def __init__(self, cache):
+		self.cache = cache		# Where the images come from
+		self.electrons = {}		# Spare electrons of each size
+		self.nucleons = {}		# Spare nucleons of each size, of any colour
+		self.made = 0		# How many actors we have made
+		self.shown = {}		# size: how many pixels across it is on screen
+
+	def pixels(self, size):
+		"""Gives how many pixels across particles of size are drawn."""
+		return self.shown.get(size, size)
+
+	def prepare(self, electron_size, nucleon_size, colours):
+		"""Make the images for particles of the given sizes and colours now,
+		eg. when a Grid is made, rather than part way through a game."""
+		electron_pixels = self.pixels(electron_size)
+		nucleon_pixels = self.pixels(nucleon_size)
+		self.cache.texture('electron_big', (electron_pixels, electron_pixels))
+		for colour in colours:
+			self.cache.texture(colour + 'proton_big', (nucleon_pixels, nucleon_pixels))
+
+	def sprite(self, name, size):
+		"""Make a new actor showing the image at size pixels across."""
+		pixels = self.pixels(size)
+		sprite = self.cache.clone(name, (pixels, pixels))
+		sprite.set_size(size, size)
+		self.made += 1
+		# Manipulate via the centre, which is right for the scaled image
+		sprite.set_anchor_point(size / 2, size / 2)
+		sprite.size = size
+		sprite.image = name
+		return sprite
+
+	def draw(self, sprite, name):
+		"""Point sprite at the image called name, drawn at the size sprite is
+		shown on screen."""
+		pixels = self.pixels(sprite.size)
+		sprite.set_parent_texture(self.cache.texture(name, (pixels, pixels)))
+		sprite.set_size(sprite.size, sprite.size)
+		sprite.image = name
+
+	def show_at(self, shown, actors):
+		"""Particles of each size in the dictionary shown (size: pixels) are
+		now that many pixels across on screen, eg. because the window has
+		been resized. Their images are drawn again at that size, rather than
+		being stretched. actors are the particles out on the board, the
+		spare ones are done as well."""
+		changed = set(size for size, pixels in shown.items() if self.pixels(size) != pixels)
+		self.shown.update(shown)
+		if not changed:
+			return
+		spares = [sprite for spare in self.electrons.values() + self.nucleons.values() for sprite in spare]
+		for sprite in list(actors) + spares:
+			if sprite.size in changed:
+				self.draw(sprite, sprite.image)
+
+	def electron(self, size):
+		"""Gives an electron actor size pixels across, reusing a spare one if
+		we have it."""
+		if self.electrons.get(size):
+			return self.electrons[size].pop()
+		return self.sprite('electron_big', size)
+
+	def nucleon(self, colour, size):
+		"""Gives a nucleon actor of the given colour and size, reusing a spare
+		one if we have it."""
+		if self.nucleons.get(size):
+			nucleon = self.nucleons[size].pop()
+			self.recolour(nucleon, colour)
+			return nucleon
+		return self.sprite(colour + 'proton_big', size)
+
+	def recolour(self, nucleon, colour):
+		"""Change the colour of a nucleon by pointing it at another texture."""
+		self.draw(nucleon, colour + 'proton_big')
+
+	def in_use(self):
+		"""Gives how many of our actors are out on the board."""
+		return self.made - sum(len(spare) for spare in self.electrons.values()) - sum(len(spare) for spare in self.nucleons.values())
+
+	def give_back_electron(self, electron):
+		"""Keep an electron, which must already be off the stage, for later."""
+		electron.hide()
+		self.electrons.setdefault(electron.size, []).append(electron)
+
+	def give_back_nucleon(self, nucleon):
+		"""Keep a nucleon, which must already be off the stage, for later."""
+		nucleon.hide()
+		self.nucleons.setdefault(nucleon.size, []).append(nucleon)
+
+# Squares borrow every particle from here, so they are only made once
+particles = ParticlePool(images)
+
+class AtomSprites:
+	# Small Squares can't show much, and drawing up to four nucleons and four
+	# moving electrons in each one costs far more than it's worth. Instead a
+	# small Square shows a single picture of its whole atom, drawn once with
+	# Cairo for each colour, number of particles and size, with the electrons
+	# standing still on their orbits
+
+	def __init__(self, directory):
+		self.renderer = Renderer(directory)		# This does the drawing
+		self.textures = {}		# (colour, count, size): the texture
+
+	def texture(self, colour, count, size):
+		"""Gives the texture of count particles of colour in a Square of size
+		(width, height). This should not be added to the stage itself."""
+		key = (colour, count, size)
+		if key not in self.textures:
+			with profiler.section('draw atom'):
+				self.textures[key] = self.draw(colour, count, size)
+		return self.textures[key]
+
+	def clone(self, colour, count, size):
+		"""Gives a new actor showing the picture of an atom."""
+		clone = clutter.CloneTexture(self.texture(colour, count, size))
+		clone.set_size(*size)
+		return clone
+
+	def draw(self, colour, count, (size_x, size_y)):
+		"""Draw an atom the way a Square lays one out, into a new texture."""
+		texture = cluttercairo.CairoTexture(width=size_x, height=size_y)
+		context = texture.cairo_create()
+		self.renderer.draw_atom(context, colour, count, (0, 0), (size_x, size_y))
+		del context		# The texture is only updated once the context has gone
+		return texture
+
+# Small Squares all share these pictures
+atoms = AtomSprites('images')
+
+class PerformanceHUD(clutter.Group):
+	# This shows what the Profiler has found out over the top of the board.
+	# Press 'p' to show or hide it
+
+	def __init__(self, interval=500):
+		"""interval is how many milliseconds to wait between updates."""
+		super(PerformanceHUD, self).__init__()
+		self.interval = interval
+		self.shown = False
+		self.source = None		# The timeout updating us while we are shown
+		# A see-through box so the text can be read over the atoms
+		self.background = clutter.Rectangle()
+		self.background.set_color(clutter.color_parse('#000000'))
+		self.background.set_opacity(180)
+		self.background.set_position(0, 0)
+		self.background.show()
+		self.add(self.background)
+		self.label = clutter.Label()
+		self.label.set_font_name('Mono 10')
+		self.label.set_color(clutter.color_parse('#FFFFFF'))
+		self.label.set_position(5, 5)
+		self.label.show()
+		self.add(self.label)
+
+	def toggle(self):
+		"""Show the HUD if it is hidden, hide it if it is shown."""
+		if self.shown:
+			self.shown = False
+			self.hide()
+			# Stop updating now, or showing us again straight away would start
+			# a second timeout alongside this one
+			gobject.source_remove(self.source)
+			self.source = None
+		else:
+			# There is nothing to show unless the Profiler is running
+			profiler.enabled = True
+			self.shown = True
+			self.update()
+			self.raise_top()
+			self.show()
+			self.source = gobject.timeout_add(self.interval, self.update)
+
+	def update(self):
+		"""Show the latest figures. Returns True to be run again while the
+		HUD is shown."""
+		if not self.shown:
+			return False
+		self.label.set_text('\n'.join(profiler.summary()))
+		self.background.set_size(self.label.get_width() + 10, self.label.get_height() + 10)
+		return True
 
 class ClutterDisplay:
 	# This is the screen where everything happens
 
-	def __init__(self, (size_x, size_y), (grid_x, grid_y), background):
+	def __init__(self, (size_x, size_y), (grid_x, grid_y), background, topology=None, detail=24):
 		self.x = size_x		# This is our horizontal size
 		self.y = size_y		# Vertical size
 		# Make a Grid which fills the display
 		# grid_x and grid_y are the numbers of columns and rows
-		self.grid = Grid((self.x, self.y), (grid_x, grid_y))
+		self.grid = Grid((self.x, self.y), (grid_x, grid_y), topology, detail)
 		self.grid.set_position(0, 0)
 		self.grid.set_size(self.x, self.y)
 		self.grid.show()
@@ -161,37 +524,408 @@ class ClutterDisplay:
 		self.stage.set_reactive(True)
 		# If the window is closed run "main_quit"
 		self.stage.connect("destroy", self.main_quit)
+		self.stage.connect("key-press-event", self.input_keys)
+		# The Grid is scaled to fit when the window changes size
+		if hasattr(self.stage, 'set_user_resizable'):
+			self.stage.set_user_resizable(True)
+		self.stage.connect("notify::width", self.resized)
+		self.stage.connect("notify::height", self.resized)
+		# Positions are saved to and loaded from this file
+		self.snapshots = 'gnucleon.snapshots'
+		# The performance HUD starts off hidden
+		self.hud = PerformanceHUD()
+		self.hud.hide()
+		self.stage.add(self.hud)
+		# Time each paint, and finish off the Profiler's frame afterwards
+		self.paint_start = 0
+		self.stage.connect("paint", self.before_paint)
+		self.stage.connect_after("paint", self.after_paint)
+		profiler.counter('actors made', lambda: particles.made)
+		profiler.counter('actors in use', particles.in_use)
+		profiler.counter('textures', lambda: len(images.textures))
+		profiler.counter('flashes showing', lambda: len(self.grid.flashes.busy))
+		profiler.counter('flashes dropped', lambda: self.grid.flashes.dropped)
+		profiler.counter('previews cached', lambda: len(self.grid.outcomes.outcomes))
 
-	# Not needed at the moment so doesn't do anything
-	def input_keys(self, arg2, arg3):
-		pass
+	def input_keys(self, stage, event):
+		"""'p' shows and hides the performance HUD, 'f' turns fast forward
+		(showing the result of each move without animating it) on and off
+		and 's' skips to the end of the animation. 'w' saves the position
+		and 'l' loads the last position saved. 'o' shows what clicking would
+		do. 'u' takes back a move and 'r' plays it again."""
+		if event.keyval == ord('p'):
+			self.hud.toggle()
+		elif event.keyval == ord('f'):
+			self.grid.animation.fast_forward = not self.grid.animation.fast_forward
+		elif event.keyval == ord('s'):
+			self.grid.animation.skip()
+		elif event.keyval == ord('o'):
+			self.grid.preview.toggle()
+		elif event.keyval == ord('u'):
+			self.grid.undo()
+		elif event.keyval == ord('r'):
+			self.grid.redo()
+		elif event.keyval == ord('w'):
+			try:
+				writer = SnapshotWriter(self.snapshots, (self.grid.board.columns, self.grid.board.rows), self.grid.board.players, self.grid.board.topology)
+			except SnapshotError, error:
+				print 'Not saving the position: %s' % error
+				return
+			writer.write(self.grid.board)
+			writer.close()
+		elif event.keyval == ord('l') and os.path.exists(self.snapshots):
+			try:
+				store = SnapshotStore(self.snapshots)
+			except SnapshotError, error:
+				print 'Not loading a position: %s' % error
+				return
+			# Positions saved from another size of board, or with other players,
+			# can't be shown on this Grid
+			if not store.layout.fits(self.grid.board):
+				print 'Not loading a position: %s holds a different size or shape of board, or players' % self.snapshots
+			elif len(store) and not self.grid.thinking:
+				self.grid.show_board(store.board(len(store) - 1))
+			store.close()
+
+	def resized(self, stage, specification):
+		"""Fit the Grid to the window's new size."""
+		self.grid.scale_to(self.stage.get_size())
+
+	def before_paint(self, stage):
+		if profiler.enabled:
+			self.paint_start = clock()
+
+	def after_paint(self, stage):
+		if profiler.enabled:
+			profiler.add('paint', clock() - self.paint_start)
+			profiler.frame()
 
 	def main_quit(self, event):
 		"""Quits the clutter main loop."""
-		clutter.main_quit
+		profiler.stop_trace()
+		clutter.main_quit()
 
 	def main(self):
 		"""Runs the clutter main loop which does the actual work."""
 		self.stage.show_all()
 		clutter.main()
 
+class AnimationScheduler:
+	# The Board works out a whole move at once, then the scheduler shows it a
+	# wave at a time. Each tick it folds the next waves into the state every
+	# Square should end up in, then updates those Squares, so a Square caught
+	# up in several explosions is only changed once and Clutter only repaints
+	# once per tick, however many particles moved. If the updates take longer
+	# than the budget the rest wait for the next tick, and if the queue gets
+	# long (or we are fast forwarding) more waves are folded in at once
+
+	def __init__(self, grid, interval=33, budget=10, backlog=20):
+		"""interval is the milliseconds between ticks, budget the most
+		milliseconds to spend updating Squares each tick. Once more than
+		backlog waves are waiting we start folding several into each tick."""
+		self.grid = grid
+		self.interval = interval
+		self.budget = budget
+		self.backlog = backlog
+		self.fast_forward = False		# Show every move's result at once
+		self.queue = []		# (colour, cells added to, cells exploding)
+		self.targets = {}		# cell: (colour, count) for Squares to update
+		self.exploded = set()		# Cells which should flash
+		self.ticking = False
+
+	def busy(self):
+		"""Whether there is anything left to show."""
+		return bool(self.queue or self.targets)
+
+	def play(self, colour, cell, reaction):
+		"""Queue up showing colour adding a particle to cell, followed by the
+		waves of reaction."""
+		if reaction.reason == CAPPED:
+			# A reaction which never settled has far too many waves to show one
+			# at a time, so it all happens in one step
+			self.queue.append((colour, [cell], reaction.exploded()))
+		else:
+			self.queue.append((colour, [cell], []))
+			for wave in reaction.waves:
+				self.queue.append((colour, [], wave))
+		if not self.ticking:
+			self.ticking = True
+			ticker.timeout_add(self.interval, self.tick)
+
+	def skip(self):
+		"""Show everything that is queued straight away."""
+		while self.queue:
+			self.fold(self.queue.pop(0))
+		self.update(None)
+
+	def target(self, cell):
+		"""Gives the (colour, count) cell will show once everything folded so
+		far has been shown."""
+		if cell in self.targets:
+			return self.targets[cell]
+		column, row = self.grid.board.position(cell)
+		return self.grid.grid[column][row].atom()
+
+	def fold(self, (colour, added, exploding)):
+		"""Work out what one step does to the Squares it touches."""
+		for cell in added:
+			self.targets[cell] = (colour, self.target(cell)[1] + 1)
+		for cell in exploding:
+			neighbours = self.grid.board.neighbours(cell)
+			owner, count = self.target(cell)
+			count -= len(neighbours)
+			if count == 0:
+				owner = None
+			self.targets[cell] = (owner, count)
+			self.exploded.add(cell)
+			for neighbour in neighbours:
+				self.targets[neighbour] = (colour, self.target(neighbour)[1] + 1)
+
+	def update(self, budget):
+		"""Change Squares to show their targets, stopping once budget
+		milliseconds have gone (unless budget is None)."""
+		start = clock()
+		for cell in list(self.targets):
+			if budget is not None and (clock() - start) * 1000 > budget:
+				return
+			colour, count = self.targets.pop(cell)
+			column, row = self.grid.board.position(cell)
+			square = self.grid.grid[column][row]
+			if cell in self.exploded:
+				self.exploded.discard(cell)
+				with profiler.section('explode'):
+					self.grid.flashes.flash((column, row))
+			square.show_atom(colour, count)
+
+	def tick(self):
+		"""Show the next part of the queue. Returns True to be run again."""
+		with profiler.section('animate'):
+			if self.fast_forward:
+				steps = len(self.queue)
+			else:
+				steps = 1 + len(self.queue) / self.backlog
+			# Only fold more in once the Squares have caught up
+			if not self.targets:
+				for step in range(steps):
+					if not self.queue:
+						break
+					self.fold(self.queue.pop(0))
+			self.update(self.budget)
+		self.ticking = self.busy()
+		return self.ticking
+
+class FlashPool:
+	# The explosion flashes. Rather than every Square having its own flash,
+	# timeline and behaviours, the Grid keeps a few and moves them to whichever
+	# Squares are exploding. Once limit flashes are showing, any more are
+	# dropped, and a Square which is already flashing just starts again
+
+	def __init__(self, grid, limit=8):
+		"""limit is the most flashes which can be showing at once."""
+		self.grid = grid
+		self.limit = limit
+		self.free = []		# Flashes which aren't showing
+		self.busy = {}		# (column, row): the flash showing there
+		self.dropped = 0		# How many flashes we didn't show
+		self.pixels = min(grid.square_size)		# How big they are on screen
+
+	def make(self):
+		"""Set up a flash and its growing and fading animation."""
+		size = min(self.grid.square_size)
+		# The image is scaled to fit once, then shared by every flash
+		flash = images.clone('electron_big', (self.pixels, self.pixels))
+		flash.set_size(size, size)
+		flash.set_opacity(0)
+		flash.set_anchor_point(size / 2, size / 2)
+		self.grid.add(flash)
+		# Keep it behind the atoms, but in front of the blue square
+		flash.lower_bottom()
+		self.grid.highlight.lower_bottom()
+		flash.timeline = ticker.timeline(30, 200)
+		flash.timeline.connect('completed', self.done, flash)
+		flash.sine_alpha = ticker.alpha(flash.timeline, 'sine')
+		flash.ramp_alpha = ticker.alpha(flash.timeline, 'ramp')
+		flash.behaviours = [BehaviourGrow(flash.ramp_alpha), BehaviourFade(flash.sine_alpha)]
+		for behaviour in flash.behaviours:
+			behaviour.apply(flash)
+		return flash
+
+	def show_at(self, pixels):
+		"""The flashes are now pixels across on screen, so draw them at that
+		size rather than stretching them."""
+		if pixels == self.pixels:
+			return
+		self.pixels = pixels
+		size = min(self.grid.square_size)
+		for flash in self.free + self.busy.values():
+			flash.set_parent_texture(images.texture('electron_big', (pixels, pixels)))
+			flash.set_size(size, size)
+
+	def flash(self, (column, row)):
+		"""Show an explosion at the Square at (column, row)."""
+		if (column, row) in self.busy:
+			# Already flashing here, so start it again
+			flash = self.busy[(column, row)]
+			flash.timeline.rewind()
+			return
+		if self.free:
+			flash = self.free.pop()
+		elif len(self.busy) < self.limit:
+			flash = self.make()
+		else:
+			self.dropped += 1
+			return
+		flash.position = (column, row)
+		self.busy[(column, row)] = flash
+		x, y = self.grid.place((column, row))
+		flash.set_position(x + self.grid.square_size[0] / 2, y + self.grid.square_size[1] / 2)
+		flash.show()
+		# A flash from the pool may not be back at the start
+		flash.timeline.rewind()
+		flash.timeline.start()
+
+	def done(self, timeline, flash):
+		"""Put a flash which has finished back in the pool."""
+		del self.busy[flash.position]
+		flash.hide()
+		self.free.append(flash)
+
+class MovePreview(clutter.Group):
+	# Shows what clicking on the Square under the cursor would do: the cells
+	# which would be taken are marked, and the size of the chain reaction and
+	# the scores afterwards are written at the bottom. Press 'o' to turn it on
+	# and off. The Outcomes come from the Grid's OutcomeCache
+
+	def __init__(self, grid):
+		super(MovePreview, self).__init__()
+		self.grid = grid
+		self.enabled = False
+		self.markers = []		# Rectangles, the first few of which are showing
+		self.label = clutter.Label()
+		self.label.set_font_name('Sans 10')
+		self.label.set_color(clutter.color_parse('#FFFFFF'))
+		self.label.show()
+		self.add(self.label)
+
+	def toggle(self):
+		"""Turn the preview on if it is off, off if it is on."""
+		self.enabled = not self.enabled
+		if self.enabled:
+			self.update(self.grid.hovered)
+		else:
+			self.update(None)
+
+	def marker(self, number):
+		"""Gives marker number, making it if we haven't got that many."""
+		while len(self.markers) <= number:
+			marker = clutter.Rectangle()
+			marker.set_size(*self.grid.square_size)
+			marker.set_color(clutter.color_parse('#FF3300'))
+			marker.set_opacity(90)
+			self.add(marker)
+			self.markers.append(marker)
+		return self.markers[number]
+
+	def update(self, position):
+		"""Show the Outcome of playing at position, a (column, row), or
+		nothing if position is None."""
+		board = self.grid.board
+		outcome = None
+		if self.enabled and position is not None and board.winner() is None:
+			with profiler.section('preview'):
+				outcome = self.grid.outcomes.outcome(board, board.index(position))
+		if outcome is None:
+			for marker in self.markers:
+				marker.hide()
+			self.hide()
+			return
+		for number, cell in enumerate(outcome.flipped):
+			marker = self.marker(number)
+			marker.set_position(*self.grid.place(board.position(cell)))
+			marker.show()
+		for marker in self.markers[len(outcome.flipped):]:
+			marker.hide()
+		scores = ', '.join('%s %d' % (board.players[player], particles) for player, cells, particles in outcome.scores(board))
+		self.label.set_text('%d explosions in %d waves, %d cells taken. Afterwards: %s' % (outcome.explosions, outcome.waves, len(outcome.flipped), scores))
+		self.label.set_position(5, self.grid.get_height() - self.label.get_height() - 5)
+		self.raise_top()
+		self.show()
+
 class Grid(clutter.Group):
 	# A Grid is a way to keep track of all of the Squares. It is a
 	# type of clutter.Group, ie. a container for actors
 
-	def __init__(self, (size_x, size_y), (squares_x, squares_y)):
+	def __init__(self, (size_x, size_y), (squares_x, squares_y), topology=None, detail=24):
+		"""topology is the shape of the board, a rectangle if not given.
+		Squares smaller than detail pixels on screen show each atom as one
+		picture, rather than as moving particles."""
 		# Standard setting up stuff
 		super(Grid, self).__init__()
 		self.set_size(size_x, size_y)
 		self.set_position(0, 0)
-		# This makes sure events are reacted to
+		# This makes sure events are reacted to. We are the only actor which
+		# does, so Clutter doesn't have to look through every Square and
+		# particle to find out what the cursor is over; we work it out from
+		# the cursor's position instead
 		self.set_reactive(True)
-		# This stores the number of turns taken, since declaring a player
-		# dead is not fair if they have yet to make their first move!
+		self.connect("button-press-event", self.clicked)
+		self.connect("motion-event", self.on_motion)
+		self.connect("leave-event", self.on_leave)
+		# The Board does the actual game, we just display it
+		global colours
+		self.board = Board((squares_x, squares_y), colours, topology)
+		# Every position reached, for undo and redo
+		self.history = History(self.board)
+		# This stores the number of turns taken, copied from the Board
 		self.turns = 0
+		# This is True while a computer player is choosing its move
+		self.thinking = False
+		# This shows moves after the Board has worked them out
+		self.animation = AnimationScheduler(self)
+		# If this is set to a RecordWriter every move is saved to it
+		self.recorder = None
 		# self.grid stores the squares in a matrix
 		self.grid = []
-		self.square_size = (size_x / squares_x, size_y / squares_y)
+		# Staggered boards need room for their odd columns to hang lower
+		self.square_size = (size_x / squares_x, int(size_y / (squares_y + self.board.topology.stagger)))
+		# self.highlight is the nice blue square. There is only one, which
+		# glides between Squares as the cursor moves. It is added first so
+		# that it is drawn behind the atoms
+		self.highlight = clutter.Rectangle()
+		self.highlight.set_size(self.square_size[0], self.square_size[1])
+		self.highlight.set_color(clutter.color_parse('#0099FF'))
+		self.highlight.set_opacity(0)
+		self.highlight.show()
+		self.add(self.highlight)
+		self.highlight_timeline = ticker.timeline(30, 500)
+		self.highlight_alpha = ticker.alpha(self.highlight_timeline, 'sine_inc')
+		self.highlight_fade = BehaviourFade(self.highlight_alpha)
+		self.highlight_fade.apply(self.highlight)
+		self.glide_timeline = ticker.timeline(30, 100)
+		self.glide_alpha = ticker.alpha(self.glide_timeline, 'ramp')
+		self.glide = BehaviourGlide(self.glide_alpha)
+		self.glide.apply(self.highlight)
+		# The (column, row) the cursor is over, or None
+		self.hovered = None
+		# Make the particles' images for this size of Square now, rather than
+		# when the first ones are played
+		electron_size, nucleon_size = particle_sizes(self.square_size)
+		particles.prepare(electron_size, nucleon_size, colours)
+		# These are moved to Squares as they explode
+		self.flashes = FlashPool(self)
+		# The smallest Squares can be on screen and still show particles, and
+		# how much we are scaled by to fit the window
+		self.detail = detail
+		self.low = False
+		self.view_scale = 1.0
+		# Changing between particles and pictures fades the new ones in
+		self.detail_timeline = ticker.timeline(30, 300)
+		self.detail_alpha = ticker.alpha(self.detail_timeline, 'ramp')
+		self.detail_fade = BehaviourFade(self.detail_alpha)
+		self.detail_timeline.connect('completed', self.detail_shown)
+		# What each move would do, and the preview which shows it
+		self.outcomes = OutcomeCache()
+		self.preview = MovePreview(self)
 		# Recursively add squares to each column, then add each column to
 		# the self.grid matrix.
 		# IMPORTANT: Left is -, right is +, up is -, down is +
@@ -199,92 +933,260 @@ class Grid(clutter.Group):
 		# the top left, etc.
 		for column in range(0, squares_x):
 			new_column = []
-			# column_type keeps track of where we are on the grid, so that
-			# the explosion limits of the square are set correctly
-			column_type = ''
-			if column == 0:
-				column_type = 'left'
-			elif column == squares_x - 1:
-				column_type = 'right'
-			else:
-				column_type = 'middle'
-			for square in range(0, squares_y):
-				if column_type == 'left':
-					if square == 0:
-						new_column.append(Square(self.square_size, (column, square), 'corner_top_left'))
-					elif square == squares_y - 1:
-						new_column.append(Square(self.square_size, (column, square), 'corner_bottom_left'))
-					else:
-						new_column.append(Square(self.square_size, (column, square), 'edge_left'))
-				elif column_type == 'right':
-					if square == 0:
-						new_column.append(Square(self.square_size, (column, square), 'corner_top_right'))
-					elif square == squares_y - 1:
-						new_column.append(Square(self.square_size, (column, square), 'corner_bottom_right'))
-					else:
-						new_column.append(Square(self.square_size, (column, square), 'edge_right'))
-				elif column_type == 'middle':
-					if square == 0 and not square == squares_y - 1:
-						new_column.append(Square(self.square_size, (column, square), 'edge_top'))
-					elif square == squares_y - 1:
-						new_column.append(Square(self.square_size, (column, square), 'edge_bottom'))
-					else:
-						new_column.append(Square(self.square_size, (column, square), 'middle'))
+			for row in range(0, squares_y):
+				square = Square(self.square_size, (column, row))
+				square.set_position(*self.place((column, row)))
+				new_column.append(square)
 			self.grid.append(new_column)
 		# Now that the squares are in self.grid we want to add them to
 		# self, the actual Grid container being drawn on the stage
+		# Holes are left empty
 		for x in self.grid:
 			for y in x:
 				self.add(y)
-				y.show()
+				if not self.board.topology.hole(self.board.index((y.column, y.row))):
+					y.show()
+		# The preview goes over the top of everything
+		self.add(self.preview)
+		self.update_detail()
+
+	def scale_to(self, (size_x, size_y)):
+		"""Scale the Grid to fit a window of the given size, changing between
+		particles and pictures if the Squares have got big or small enough."""
+		width, height = self.get_size()
+		self.view_scale = min(size_x / float(width), size_y / float(height))
+		self.set_scale(self.view_scale, self.view_scale)
+		# Draw the particles as big as they now are on screen, so they stay
+		# sharp rather than being stretched
+		shown = (int(self.square_size[0] * self.view_scale), int(self.square_size[1] * self.view_scale))
+		electron_size, nucleon_size = particle_sizes(self.square_size)
+		electron_pixels, nucleon_pixels = particle_sizes(shown)
+		actors = [actor for column in self.grid for square in column for actor in square.electrons + square.nucleons]
+		particles.show_at({electron_size: electron_pixels, nucleon_size: nucleon_pixels}, actors)
+		self.flashes.show_at(max(1, min(shown)))
+		self.update_detail()
+
+	def update_detail(self):
+		"""Show particles or pictures, depending on how big the Squares are
+		on screen."""
+		low = min(self.square_size) * self.view_scale < self.detail
+		if low == self.low:
+			return
+		self.low = low
+		self.animation.skip()
+		appeared = []
+		for column in self.grid:
+			for square in column:
+				appeared.extend(square.set_detail(low))
+		# Fade in whatever has just appeared, rather than popping it in
+		self.detail_fade.remove_all()
+		for actor in appeared:
+			actor.set_opacity(0)
+			self.detail_fade.apply(actor)
+		self.detail_timeline.rewind()
+		self.detail_timeline.start()
 
-	def add_particle(self, (column, row)):
-		"""Add a particle to the square at (column, row)"""
+	def detail_shown(self, timeline):
+		"""Let go of the actors which have finished fading in."""
+		for actor in self.detail_fade.get_actors():
+			actor.set_opacity(255)
+		self.detail_fade.remove_all()
+
+	def place(self, (column, row)):
+		"""Gives the stage position of the top left of the Square at
+		(column, row). Odd columns are drawn lower on staggered (eg. hex)
+		boards."""
+		shift = self.board.topology.stagger * (column % 2)
+		return (column * self.square_size[0], int((row + shift) * self.square_size[1]))
+
+	def square_at(self, x, y):
+		"""Gives the (column, row) of the Square at the given stage
+		coordinates, or None if there isn't one there."""
+		grid_x, grid_y = self.get_position()
+		if x < grid_x or y < grid_y:
+			return None
+		x = (x - grid_x) / self.view_scale
+		y = (y - grid_y) / self.view_scale
+		column = int(x / self.square_size[0])
+		row = int(math.floor(y / float(self.square_size[1]) - self.board.topology.stagger * (column % 2)))
+		if 0 <= column < self.board.columns and 0 <= row < self.board.rows and not self.board.topology.hole(self.board.index((column, row))):
+			return (column, row)
+		return None
+
+	def clicked(self, actor, event):
+		"""Play a move on the Square that was clicked on."""
+		position = self.square_at(event.x, event.y)
+		if position is not None:
+			self.move(position)
+
+	def on_motion(self, actor, event):
+		"""Move the blue square to whichever Square the cursor is over."""
+		position = self.square_at(event.x, event.y)
+		if position == self.hovered:
+			return
+		if position is None:
+			self.on_leave(actor, event)
+			return
+		x, y = self.place(position)
+		if self.hovered is None:
+			# Just appearing, so start off in the right place
+			self.glide_timeline.stop()
+			self.highlight.set_position(x, y)
+		else:
+			self.glide.start = self.highlight.get_position()
+			self.glide.end = (x, y)
+			self.glide_timeline.rewind()
+			self.glide_timeline.start()
+		self.hovered = position
+		self.preview.update(position)
+		# We use one timeline for going forwards and backwards, switching
+		# direction. This stops any jumping around if the leave animation
+		# starts before the enter animation has finished
+		self.highlight_timeline.set_direction(clutter.TIMELINE_FORWARD)
+		self.highlight_timeline.start()
+
+	def on_leave(self, actor, event):
+		"""Fade the blue square when the cursor leaves the Grid."""
+		self.hovered = None
+		self.preview.update(None)
+		self.highlight_timeline.set_direction(clutter.TIMELINE_BACKWARD)
+		self.highlight_timeline.start()
+
+	def move(self, (column, row)):
+		"""Play the current player's move at (column, row) on the Board then
+		show what happened. Returns False if the move is illegal, or if a
+		computer player is still thinking."""
 		global current_colour
-		self.grid[column][row].add_particle(current_colour, True)
+		if self.thinking:
+			return False
+		cell = self.board.index((column, row))
+		with profiler.section('resolve'):
+			reaction = self.board.move(cell)
+		if reaction is None:
+			return False
+		if self.recorder is not None:
+			self.recorder.move(cell)
+		# Only the previews which looked at cells this move changed are wrong now
+		self.outcomes.played(self.board, cell, reaction)
+		self.history.played(cell, reaction)
+		# The Board is already up to date, so nothing waits for the animation
+		self.animation.play(current_colour, cell, reaction)
+		self.turns = self.board.turns
+		self.check_players()
+		self.preview.update(self.hovered)
+		self.next_turn()
+		return True
+
+	def next_turn(self):
+		"""If it is a computer player's turn then start them thinking."""
+		global bots
+		global current_colour
+		if current_colour in bots and self.board.winner() is None:
+			self.thinking = True
+			bots[current_colour].think(self.board)
+			# Keep checking for an answer without blocking the main loop
+			ticker.timeout_add(20, self.check_bot, bots[current_colour])
+
+	def check_bot(self, bot):
+		"""Play the computer player's move if it has decided. Returns True
+		to be run again if it hasn't."""
+		result = bot.poll()
+		if result is None:
+			return True
+		# How the search went is only wanted when we are looking at performance
+		if profiler.enabled:
+			print '%s: depth %d, %d nodes in %d of %d ms (%d nodes/s, %d%% table hits)' % (current_colour, result.depth, result.nodes, result.elapsed, result.budget, result.nodes_per_second(), 100 * result.table['hit_rate'])
+		self.thinking = False
+		self.move(self.board.position(result.move))
+		return False
 
-	def explode(self, (column, row)):
-		"""Run the explode function of the square at (column, row)"""
-		self.grid[column][row].explode()
+	def undo(self):
+		"""Take back the last move, and any computer players' moves before
+		it, so that a person can play again. Returns False if there was
+		nothing to take back or a computer player is thinking."""
+		global bots
+		if self.thinking or self.history.state.parent is None:
+			return False
+		self.animation.skip()
+		changed = set()
+		while True:
+			changed.update(self.history.undo())
+			if self.recorder is not None:
+				self.recorder.undo()
+			if self.history.state.parent is None or self.board.players[self.board.current] not in bots:
+				break
+		self.show_cells(changed)
+		return True
 
-	def add_turn(self):
-		"""Increment the turns taken by 1."""
-		self.turns += 1
+	def redo(self):
+		"""Play the last move taken back again, and any computer players'
+		moves after it. Returns False if there is nothing to play again."""
+		global bots
+		if self.thinking:
+			return False
+		self.animation.skip()
+		changed = set()
+		while True:
+			redone = self.history.redo()
+			if redone is None:
+				break
+			cell, cells = redone
+			changed.update(cells)
+			if self.recorder is not None:
+				self.recorder.move(cell)
+			if self.board.players[self.board.current] not in bots:
+				break
+		if not changed:
+			return False
+		self.show_cells(changed)
+		# If there was nothing more to redo it may be a computer's turn
+		self.next_turn()
+		return True
+
+	def show_cells(self, cells):
+		"""Show the Board's cells straight away, eg. after undoing."""
+		for cell in cells:
+			column, row = self.board.position(cell)
+			if self.board.counts[cell]:
+				self.grid[column][row].show_atom(self.board.players[self.board.owners[cell]], self.board.counts[cell])
+			else:
+				self.grid[column][row].show_atom(None, 0)
+		self.outcomes.changed(cells)
+		self.turns = self.board.turns
+		self.check_players()
+		self.preview.update(self.hovered)
+
+	def show_board(self, board):
+		"""Take on board, which must be the same size and shape as our Board,
+		as our Board, and show it straight away."""
+		self.animation.skip()
+		self.board = board
+		self.history = History(board)
+		self.outcomes.clear()
+		if self.recorder is not None:
+			# A record is replayed from an empty board, so moves after this
+			# couldn't be played back from it
+			print 'Stopped recording: a loaded position can not be put in a game record'
+			self.recorder.close()
+			self.recorder = None
+		self.show_cells(xrange(board.size))
+		# It may be a computer player's turn in the new position
+		self.next_turn()
 
 	def check_players(self):
-		'''Check whether any players have been eliminated.'''
+		'''Copy the players still in play, and whose turn it is, from the Board.'''
 		global colours
 		global current_colour
-		# Only check if every player has had at least one turn
-		if self.turns > len(colours):
-			new_colours = []		# This will store the colours still in play
-			# Not very efficient here, but the colour order must be preserved
-			for colour in colours:
-				alive = False		# Assume this colour is gone
-				# Check the colour of every square, if it matches then mark it alive
-				for row in self.grid:
-					for square in row:
-						if square.colour == colour:
-							alive = True
-				# Add the colour to those still in play if it was found
-				if alive:
-					new_colours.append(colour)
-			colours = new_colours
+		colours = [self.board.players[player] for player in self.board.alive]
+		current_colour = self.board.players[self.board.current]
 
 class Square(clutter.Group):
 	# Square is a clutter.Group which holds the actors for the atoms
 
-	def __init__(self, (size_x, size_y), (position_x, position_y), type):
-		global electron_alpha		# This makes all electrons stay in sync
+	def __init__(self, (size_x, size_y), (position_x, position_y)):
 		super(Square, self).__init__()
-		# This makes the Square respond to events
-		self.set_reactive(True)
-		# This tells the program to run "clicked", "on_enter" and "on_leave"
-		# when the Square is clicked on, has the cursor enter and has the
-		# cursor leave respectively
-		self.connect("button-press-event", self.clicked, self)
-		self.connect("enter-event", self.on_enter, self)
-		self.connect("leave-event", self.on_leave, self)
+		# Squares don't react to events themselves, the Grid works out which
+		# Square the cursor is over
 		# Squares start out without an owner/colour
 		self.colour = None
 		# Store and set the Square size
@@ -296,73 +1198,20 @@ class Square(clutter.Group):
 		# The position can be calculated as the size of a square multiplied
 		# by the number of squares along/down it is
 		self.set_position(size_x * position_x, size_y * position_y)
-		# self.rectangle makes the nice blue square appear
-		self.rectangle = clutter.Rectangle()
-		self.add(self.rectangle)
-		#self.rectangle.set_position(size_x * position_x, size_y * position_y)
-		self.rectangle.set_position(0, 0)
-		self.rectangle.set_size(self.size_x, self.size_y)
-		self.rectangle.set_color(clutter.color_parse('#0099FF'))
-		self.rectangle.set_opacity(0)
-		self.rectangle.show()
-		self.rectangle_timeline = clutter.Timeline(fps=30, duration=500)
-		self.rectangle_alpha = clutter.Alpha(self.rectangle_timeline, clutter.sine_inc_func)
-		self.rectangle_behaviour = BehaviourFade(self.rectangle_alpha)
-		self.rectangle_behaviour.apply(self.rectangle)
-
-		# self.flash is the explosion animation
-		self.flash_pixmap = gtk.gdk.pixbuf_new_from_file('images/electron_big.png')
-		self.flash = clutter.Texture(self.flash_pixmap)
-		self.flash.set_opacity(0)
-		self.add(self.flash)
-		self.flash.set_size(min((self.size_x, self.size_y)), min((self.size_x, self.size_y)))
-		self.flash.set_anchor_point(self.flash.get_width() / 2, self.get_height() / 2)
-		self.flash.set_position(self.flash.get_width() / 2, self.flash.get_height() / 2)
-		self.flash.show()
-		self.flash_timeline = clutter.Timeline(fps=30, duration=200)
-		self.flash_sine_alpha = clutter.Alpha(self.flash_timeline, clutter.sine_func)
-		self.flash_ramp_alpha = clutter.Alpha(self.flash_timeline, clutter.ramp_inc_func)
-		self.flash_behaviours = [BehaviourGrow(self.flash_ramp_alpha), BehaviourFade(self.flash_sine_alpha)]
-		for behaviour in self.flash_behaviours:
-			behaviour.apply(self.flash)
-
 		# Start out with no nucleons or electrons
 		self.nucleons = []
 		self.electrons = []
-		# These are the electrons' orbits and spin
-		self.electron_behaviours = {'horizontal_orbit':BehaviourOrbit(electron_alpha, size_x / 2, size_y / 8, 0, (size_x / 2, size_y / 2)),\
-		                            'vertical_orbit':BehaviourOrbit(electron_alpha, size_x / 8.0, size_y / 2, 0, (size_x / 2, size_y / 2)),\
-   		                            'diagonal_orbit':BehaviourOrbit(electron_alpha, size_x / 8.0, size_y / 2, -45, (size_x / 2, size_y / 2)),\
-		                            'antidiagonal_orbit':BehaviourOrbit(electron_alpha, size_x / 2, size_y / 8, -45, (size_x / 2, size_y / 2)),\
-		                            'spin':BehaviourSpin(electron_alpha)}
-		# Calculate the explosion size for this atom
-		# It must be at least 2, so start with that
-		self.limit = 2
-		self.type = type
-		# corner will stay as 2
-		if self.type[0] is not 'c':
-			# Everything else goes up to 3
-			self.limit += 1
-			# edge will stay as 3
-			if self.type[0] is not 'e':
-				# Everything else will go up to 4
-				self.limit += 1
-
-	def on_enter(self, action, event, widget):
-		"""Display a blue square on mouse-over."""
-		# We use one timeline for going forwards and backwards, switching
-		# direction. This stops any jumping around if the leave animation
-		# starts before the enter animation has finished
-		self.rectangle_timeline.set_direction(clutter.TIMELINE_FORWARD)
-		self.rectangle_timeline.start()
-
-	def on_leave(self, action, event, widget):
-		"""Fade the blue square when the cursor leaves the square."""
-		# We use one timeline for going forwards and backwards, switching
-		# direction. This stops any jumping around if the leave animation
-		# starts before the enter animation has finished
-		self.rectangle_timeline.set_direction(clutter.TIMELINE_BACKWARD)
-		self.rectangle_timeline.start()
+		# These are the electrons' orbits as (width, height, tilt). The
+		# OrbitDriver moves and spins them
+		self.orbits = render.orbits((size_x, size_y))
+		# The particles are made at these sizes in pixels: electrons 1/18th and
+		# nucleons a quarter of the smallest side of the Square
+		self.electron_size, self.nucleon_size = particle_sizes((size_x, size_y))
+		# When low is True the atom is shown as one picture, the sprite,
+		# rather than as particles. count is how many particles it shows
+		self.low = False
+		self.sprite = None
+		self.count = 0
 
 	# This only exists to remind me how to draw circles with Cairo
 	def commented(self):
@@ -393,300 +1242,223 @@ class Square(clutter.Group):
 		#		behaviour.apply(cairo_tex)
 		#	cairo_tex.show()
 
-	def clicked(self, action, event, widget):
-		"""Do stuff needed when clicked."""
-		global current_colour
-		global colours
-		# added will be True if a particle gets added (ie. the move is
-		# valid) and False if not (ie. that is an illegal move)
-		added = self.add_particle(current_colour)
-		if added:
-			# If the move is legal then a particle was added. Now check
-			# if we should explode
-			self.explode()
-			# Increment the turn counter of the Grid by 1
-			self.get_parent().add_turn()
-			# Eliminate anyone taken out by that move
-			self.get_parent().check_players()
-			# Next player's turn
-			# If we are the last player then go back to the first player
-			if colours.index(current_colour) == len(colours) - 1:
-				current_colour = colours[0]
-			# Otherwise go to the next player
-			else:
-				current_colour = colours[colours.index(current_colour) + 1]
-
-
 	def add_electron(self):
 		"""Add an electron to the atom."""
-		# This is meant to keep memory use down by using small images if the
-		# image on screen is small anyway. Doesn't work at the moment since
-		# using the small image only displays a corner, so always use big one
-		#if min((self.size_x, self.size_y)) / 18.0 > 25:
-		pixbuf = gtk.gdk.pixbuf_new_from_file('images/electron_big.png')
-		#else:
-		#pixbuf = gtk.gdk.pixbuf_new_from_file('images/electron_small.png')
-		# Set up a clutter.Texture with the electron image. This is our actor
-		texture = clutter.Texture(pixbuf)
-		texture.set_anchor_point(texture.get_width() / 2, texture.get_height() / 2)		# Manipulate via the centre
+		# Borrow an electron rather than making a new one
+		texture = particles.electron(self.electron_size)
 		texture.set_position(0, 0)
-		# The scale factor makes the electron 1/18th of the smallest dimension
-		# of the Square
-		texture.scale_factor = min(((self.size_x + 0.0) / (18.0 * texture.get_width()), ((self.size_y + 0.0) / 18.0 * texture.get_height())))
-		texture.set_scale(texture.scale_factor, texture.scale_factor)
+		# The electron is already the right size, so its standard scale is 1
+		texture.scale_factor = 1.0
+		texture.set_scale(1.0, 1.0)
 		# Add to our list of electrons
 		self.electrons.append(texture)
-		# Make the electron spin
-		self.electron_behaviours['spin'].apply(texture)
 		# Depending on which electron we are, choose an orbit
-		if len(self.electrons) == 1:
-			self.electron_behaviours['horizontal_orbit'].apply(texture)
-		elif len(self.electrons) == 2:
-			self.electron_behaviours['vertical_orbit'].apply(texture)
-		elif len(self.electrons) == 3:
-			self.electron_behaviours['diagonal_orbit'].apply(texture)
-		elif len(self.electrons) == 4:
-			self.electron_behaviours['antidiagonal_orbit'].apply(texture)
+		width, height, tilt = self.orbits[(len(self.electrons) - 1) % len(self.orbits)]
+		orbits.register(texture, width, height, tilt, (self.size_x / 2, self.size_y / 2))
 		# Display the electron and add to the Square (which is a clutter.Group)
 		texture.show()
 		self.add(texture)
 
 	def add_nucleon(self, colour):
 		"""Add a nucleon to the current atom."""
-		# This is meant to keep memory use down by using small images if the
-		# image on screen is small anyway. Doesn't work at the moment since
-		# using the small image only displays a corner, so always use big one
-		#if (min((self.size_x, self.size_y)) + 0.0) / 4.0 > 25:
-		pixbuf = gtk.gdk.pixbuf_new_from_file('images/' + colour + 'proton_big.png')
-		#else:
-		#	pixbuf = gtk.gdk.pixbuf_new_from_file('images/' + colour + 'proton_small.png')
-		texture = clutter.Texture(pixbuf)
-		#texture.set_position(0, 0)
-		texture.set_anchor_point(texture.get_width() / 2, texture.get_height() / 2)
+		# Borrow a nucleon, which is already the right colour
+		texture = particles.nucleon(colour, self.nucleon_size)
 		self.nucleons.append(texture)
-		radius = min(((self.size_x + 0.0) / 4.0) / (texture.get_width() + 0.0), ((self.size_y + 0.0) / 4.0) / (texture.get_height() + 0.0))
-		texture.scale_factor = radius
-		texture.set_scale(radius, radius)
-
-		if len(self.nucleons) == 1:
-			texture.set_position(self.size_x / 2, self.size_y / 2)
-		elif len(self.nucleons) == 2:
-			texture.set_position(self.size_x / 2 - self.size_x / 8, self.size_y / 2)
-			self.nucleons[0].set_position(self.size_x / 2 + self.size_x / 8, self.size_y / 2)
-		elif len(self.nucleons) == 3:
-			texture.set_position(self.size_x / 2, self.size_y / 2 - self.size_y / 8)
-			self.nucleons[0].set_position(self.size_x / 2 - self.size_x / 8, self.size_y / 2 + self.size_y / 8)
-			self.nucleons[1].set_position(self.size_x / 2 + self.size_x / 8, self.size_y / 2 + self.size_y / 8)
-		elif len(self.nucleons) == 4:
-			texture.set_position(self.size_x / 2 - self.size_x / 8, self.size_y / 2 - self.size_y / 8)
-			self.nucleons[1].set_position(self.size_x / 2 + self.size_x / 8, self.size_y / 2 - self.size_y / 8)
-			self.nucleons[0].set_position(self.size_x / 2 - self.size_x / 8, self.size_y / 2 + self.size_y / 8)
-			self.nucleons[2].set_position(self.size_x / 2 + self.size_x / 8, self.size_y / 2 + self.size_y / 8)
-		#texture.set_scale(radius, radius)
+		texture.scale_factor = 1.0
+		self.arrange_nucleons()
 		self.add(texture)
 		texture.show()
 
-	def add_particle(self, colour, explosion=False):
-		if explosion:
-			self.colour = colour
-			self.change_colour()
+	def arrange_nucleons(self):
+		"""Lay out the nucleons depending on how many there are."""
+		# Every nucleon is put in place, so none is left where it was in the
+		# last Square which borrowed it
+		for nucleon, (place_x, place_y) in zip(self.nucleons, render.nucleon_places(len(self.nucleons))):
+			nucleon.set_position(self.size_x / 2 + place_x * (self.size_x / 8), self.size_y / 2 + place_y * (self.size_y / 8))
+
+	def add_particle(self, colour):
 		if self.colour is None or self.colour == colour:
 			self.add_nucleon(colour)
 			self.add_electron()
 			self.colour = colour
-			#if len(self.electrons) >= self.limit:
-			#	self.explode()
 			return True
 		else:
 			return False
 
 	def change_colour(self):
-		number = len(self.electrons)
-		self.clear()
-		for particle in range(0, number):
-			self.add_particle(self.colour)
+		"""Make every nucleon we have the colour of self.colour."""
+		# The nucleons are recoloured where they are, so nothing is made
+		for nucleon in self.nucleons:
+			particles.recolour(nucleon, self.colour)
 
 	def clear(self):
-		# FIXME: This may be causing memory leaks (are the particles
-		# still referenced by their behaviours, thus not getting garbage
-		# collected?)
-		for electron in self.electrons:
-			self.remove(electron)
-			for behaviour in self.electron_behaviours:
-				try:
-					behaviour.remove(electron)
-				except:
-					pass
-		self.electrons = []
-		for nucleon in self.nucleons:
-			self.remove(nucleon)
-		self.nucleons = []
-		self.remove_all()
-		print self.get_children
-		#while gc.collect():
-		#	pass
+		"""Give every particle back to the pool."""
+		while self.electrons:
+			self.remove_particle()
+
+	def drop_electron(self, electron):
+		"""Take an electron off the Square and out of its behaviours, then
+		give it back to the pool."""
+		self.remove(electron)
+		# If the OrbitDriver kept hold of it the electron would still be
+		# moved around after being given back
+		if orbits.is_applied(electron):
+			orbits.unregister(electron)
+		particles.give_back_electron(electron)
 
 	def remove_particle(self):
-		global current_colour
-		# Remove an electron and a nucleon pair from the lists, the Square
-		# and any behaviours they have applied.
-		# FIXME: This may be causing memory leaks (are the particles
-		# still referenced by their behaviours, thus not getting garbage
-		# collected?)
-		to_remove = self.electrons.pop()
-		self.remove(to_remove)
-		for behaviour in self.electron_behaviours.keys():
-			try:
-				self.electron_behaviours[behaviour].remove(to_remove)
-			except:
-				pass
+		# Remove an electron and a nucleon pair from the lists and the Square,
+		# and give them back to the pool. Since we always take the last ones
+		# the electrons left behind keep their orbits, and only the nucleons
+		# need laying out again
+		self.drop_electron(self.electrons.pop())
 		to_remove = self.nucleons.pop()
 		self.remove(to_remove)
-		# Check to see if we need to rearrange any left behind
+		particles.give_back_nucleon(to_remove)
 		if len(self.electrons) > 0:
-			# If so remove one
-			self.remove(self.electrons.pop())
-			self.remove(self.nucleons.pop())
-			# Then add it back since the layout is set during add
-			self.add_nucleon(current_colour)
-			self.add_electron()
+			self.arrange_nucleons()
 		else:
 			# If there aren't any left behind then the atom has no owner
 			self.colour = None
-		#while gc.collect():
-		#	pass
-
-	def send_left(self):
-		"""Remove a nucleon from the current Square and add one to the
-		Square on the left."""
-		clutter.redraw()
-		self.remove_particle()
-		self.get_parent().add_particle((self.column - 1, self.row))
-
-	def send_right(self):
-		"""Remove a nucleon from the current Square and add one to the
-		Square on the right."""
-		clutter.redraw()
-		self.remove_particle()
-		self.get_parent().add_particle((self.column + 1, self.row))
-
-	def send_up(self):
-		"""Remove a nucleon from the current Square and add one to the
-		Square above."""
-		clutter.redraw()
-		self.remove_particle()
-		self.get_parent().add_particle((self.column, self.row - 1))
-
-	def send_down(self):
-		"""Remove a nucleon from the current Square and add one to the
-		Square below."""
-		clutter.redraw()
-		self.remove_particle()
-		self.get_parent().add_particle((self.column, self.row + 1))
-
-	def explode(self):
-		"""If the limit of the current Square has been reached then
-		remove the nucleons from this Square and send them to neighbours."""
-		# Chain reactions are implemented so that atoms explode followed
-		# by their neighbours. A more elegant solution follows the
-		# reaction to the end and works back, however this can go over
-		# the maximum recursion depth, plus a critical/supercritical
-		# mass in play wouldn't work as explosions would never end
-		# Only explode if the atom has too many nucleons
-		if len(self.electrons) >= self.limit:
-			# Start the flash animation for an explosion effect
-			self.flash_timeline.start()
-			if self.type == 'corner_top_left':
-				self.send_right()
-				self.send_down()
-				# Check if the atoms just added to need to explode
-				self.get_parent().explode((self.column + 1, self.row))
-				self.get_parent().explode((self.column, self.row + 1))
-			elif self.type == 'corner_top_right':
-				self.send_left()
-				self.send_down()
-				# Check if the atoms just added to need to explode
-				self.get_parent().explode((self.column + -1, self.row))
-				self.get_parent().explode((self.column, self.row + 1))
-			elif self.type == 'corner_bottom_left':
-				self.send_right()
-				self.send_up()
-				# Check if the atoms just added to need to explode
-				self.get_parent().explode((self.column, self.row - 1))
-				self.get_parent().explode((self.column + 1, self.row))
-			elif self.type == 'corner_bottom_right':
-				self.send_left()
-				self.send_up()
-				# Check if the atoms just added to need to explode
-				self.get_parent().explode((self.column + -1, self.row))
-				self.get_parent().explode((self.column, self.row - 1))
-			elif self.type == 'edge_left':
-				self.send_up()
-				self.send_down()
-				self.send_right()
-				# Check if the atoms just added to need to explode
-				self.get_parent().explode((self.column, self.row - 1))
-				self.get_parent().explode((self.column, self.row + 1))
-				self.get_parent().explode((self.column + 1, self.row))
-			elif self.type == 'edge_right':
-				self.send_up()
-				self.send_down()
-				self.send_left()
-				# Check if the atoms just added to need to explode
-				self.get_parent().explode((self.column, self.row - 1))
-				self.get_parent().explode((self.column, self.row + 1))
-				self.get_parent().explode((self.column + -1, self.row))
-			elif self.type == 'edge_top':
-				self.send_left()
-				self.send_right()
-				self.send_down()
-				# Check if the atoms just added to need to explode
-				self.get_parent().explode((self.column + -1, self.row))
-				self.get_parent().explode((self.column + 1, self.row))
-				self.get_parent().explode((self.column, self.row + 1))
-			elif self.type == 'edge_bottom':
-				self.send_left()
-				self.send_right()
-				self.send_up()
-				# Check if the atoms just added to need to explode
-				self.get_parent().explode((self.column + -1, self.row))
-				self.get_parent().explode((self.column + 1, self.row))
-				self.get_parent().explode((self.column, self.row - 1))
-			else:
-				self.send_up()
-				self.send_down()
-				self.send_left()
-				self.send_right()
-				# Check if the atoms just added to need to explode
-				self.get_parent().explode((self.column, self.row - 1))
-				self.get_parent().explode((self.column, self.row + 1))
-				self.get_parent().explode((self.column + -1, self.row))
-				self.get_parent().explode((self.column + 1, self.row))
+
+	def atom(self):
+		"""Gives the (colour, count) the Square is showing."""
+		if self.low:
+			return (self.colour, self.count)
+		return (self.colour, len(self.electrons))
+
+	def set_detail(self, low):
+		"""Show the atom as one picture if low is True, or as particles.
+		Returns the actors which have just appeared."""
+		if low == self.low:
+			return []
+		colour, count = self.atom()
+		if low:
+			self.clear()
+		elif self.sprite is not None:
+			self.sprite.hide()
+		self.low = low
+		self.colour = None
+		self.show_atom(colour, count)
+		if low:
+			return [self.sprite] if count else []
+		return self.electrons + self.nucleons
+
+	def show_sprite(self, colour, count):
+		"""Show the picture of count particles belonging to colour."""
+		self.colour = colour
+		self.count = count
+		if count == 0:
+			self.colour = None
+			if self.sprite is not None:
+				self.sprite.hide()
+			return
+		size = (self.size_x, self.size_y)
+		if self.sprite is None:
+			self.sprite = atoms.clone(colour, count, size)
+			self.add(self.sprite)
+		else:
+			self.sprite.set_parent_texture(atoms.texture(colour, count, size))
+		self.sprite.show()
+
+	def show_atom(self, colour, count):
+		"""Change the particles to show count of them belonging to colour."""
+		if self.low:
+			self.show_sprite(colour, count)
+			return
+		if count == 0:
+			self.clear()
+			return
+		if colour != self.colour:
+			self.colour = colour
+			self.change_colour()
+		while len(self.electrons) < count:
+			self.add_particle(colour)
+		while len(self.electrons) > count:
+			self.remove_particle()
 
 # This is where execution starts
 if __name__ == '__main__':
-	# Keep all electrons in sync
-	global electron_alpha
-	electron_timeline = clutter.Timeline(fps=50, duration=1500)
-	electron_timeline.set_loop(True)
-	electron_alpha = clutter.Alpha(electron_timeline, clutter.ramp_inc_func)
-	electron_timeline.start()
+	parser = optparse.OptionParser(usage='%prog [options]')
+	parser.add_option('--profile', action='store_true', default=False,
+	                  help="time each frame (press 'p' to see the results)")
+	parser.add_option('--trace', metavar='FILE',
+	                  help='write the timings of every frame to FILE as CSV')
+	parser.add_option('--record', metavar='FILE',
+	                  help='save every move of the game to FILE')
+	parser.add_option('--shape', choices=sorted(topology.SHAPES), default='rectangle',
+	                  help='the shape of the board: %s [%%default]' % ', '.join(sorted(topology.SHAPES)))
+	parser.add_option('--mask', metavar='FILE',
+	                  help="take the board's size and holes from a picture in FILE, with '#' for a hole")
+	parser.add_option('--detail', type='int', metavar='PIXELS', default=24,
+	                  help='show atoms in Squares smaller than this as still pictures [%default]')
+	parser.add_option('--clock', choices=['real', 'virtual'], default='real',
+	                  help='run animations off the real clock, or a virtual one which moves on a frame at a time [%default]')
+	parser.add_option('--fps', type='int', default=60,
+	                  help='frames per second of the virtual clock [%default]')
+	parser.add_option('--speed', type='float', default=1.0,
+	                  help='how many times faster than real time the virtual clock runs [%default]')
+	parser.add_option('--players', default='green', metavar='COLOURS',
+	                  help='the colours playing, in turn order, from blue, green, red and yellow [%default]')
+	parser.add_option('--bot', action='append', default=[], metavar='COLOUR[:MS]',
+	                  help='have the computer play COLOUR, thinking for up to MS milliseconds a move [500] (can be given more than once)')
+	parser.add_option('--snapshots', metavar='FILE', default='gnucleon.snapshots',
+	                  help="where 'w' saves positions and 'l' loads them from [%default]")
+	options, arguments = parser.parse_args()
+	profiler.enabled = options.profile or options.trace is not None
+	if options.trace:
+		profiler.start_trace(options.trace)
+
+	if options.clock == 'virtual':
+		# Step the virtual clock from the main loop, so the animation is the
+		# same frame for frame however busy the machine is
+		ticker = VirtualClock(options.fps)
+		ticker.attach(options.speed)
+	start_electrons()
 
 	# Define the players. Each colour must have a corresponding image
 	# called colourproton_big.png in the images folder
 	# Players are cycled through in the list order
 	global colours
 	global current_colour
-	#colours = ['green', 'yellow', 'red', 'blue']
-	colours = ['green']
-	current_colour = 'green'
+	colours = options.players.split(',')
+	# Any colours in here are played by the computer. A bot's colour joins
+	# the game if it wasn't given as a player
+	global bots
+	bots = {}
+	for bot in options.bot:
+		colour, colon, budget = bot.partition(':')
+		if colour not in colours:
+			colours.append(colour)
+		bots[colour] = ai.Bot(budget=int(budget or 500))
+	if bots and ai.multiprocessing is None:
+		# Bots think in threads then, which only get to run while the main
+		# loop is waiting if GObject knows about them
+		gobject.threads_init()
+	for colour in colours:
+		if not os.path.exists(os.path.join('images', colour + 'proton_big.png')):
+			parser.error('there is no image for the colour %s' % colour)
+	current_colour = colours[0]
 
-	# Set the board size
+	# Set the board size and shape
 	columns = 8
 	rows = 6
+	shape = None
+	if options.mask:
+		mask = open(options.mask)
+		(columns, rows), holes = topology.read_mask(mask)
+		mask.close()
+		shape = topology.masked(topology.topology(options.shape, (columns, rows)), holes)
+	elif options.shape != 'rectangle':
+		shape = topology.topology(options.shape, (columns, rows))
 
 	# Set up the board
-	display = ClutterDisplay((800, 600), (columns, rows), "#000000")
+	display = ClutterDisplay((800, 600), (columns, rows), "#000000", shape, options.detail)
+	display.snapshots = options.snapshots
+	if options.record:
+		display.grid.recorder = RecordWriter(options.record, (columns, rows), colours, topology=display.grid.board.topology)
+	# A computer player may have the first move
+	display.grid.next_turn()
 
 	# Run the game
 	display.main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+# Positions which are never changed once made, for undo, redo and trying out
+# moves. A State keeps the counts and owners of a Board in chunks of CHUNK
+# cells, and the chunks in groups of GROUP. A move only makes new copies of
+# the chunks it changed (and the groups holding them), and shares everything
+# else with the State it was played from, so a long game or a big tree of
+# analysis costs little more memory than the cells which actually changed.
+# Moving a Board between two States only copies the chunks which differ,
+# which are found by comparing the chunks themselves rather than their cells
+from array import array
+
+# How many cells are in each chunk
+CHUNK = 64
+
+# How many chunks are in each group
+GROUP = 32
+
+def split(values, typecode):
+	"""Gives values (an array) as a tuple of groups of chunks."""
+	chunks = [array(typecode, values[start:start + CHUNK]) for start in xrange(0, len(values), CHUNK)]
+	return tuple(tuple(chunks[start:start + GROUP]) for start in xrange(0, len(chunks), GROUP))
+
+def replace(groups, chunks):
+	"""Gives groups with the chunks in the dictionary chunks (chunk number:
+	new chunk) put in, sharing every group which doesn't change."""
+	groups = list(groups)
+	for number, chunk in chunks.items():
+		group = list(groups[number / GROUP])
+		group[number % GROUP] = chunk
+		groups[number / GROUP] = tuple(group)
+	return tuple(groups)
+
+def differences(first, second):
+	"""Gives the numbers of the chunks which aren't shared between two
+	tuples of groups."""
+	numbers = []
+	for place, (group, other) in enumerate(zip(first, second)):
+		if group is not other:
+			numbers.extend(place * GROUP + number for number, (chunk, other_chunk) in enumerate(zip(group, other)) if chunk is not other_chunk)
+	return numbers
+
+class State:
+	# One position, which mustn't be changed. Apart from the cells this is
+	# everything a Board keeps track of, so a Board can be put back exactly
+
+	def __init__(self, board, counts, owners, parent=None, move=None):
+		"""counts and owners are groups of chunks, the rest comes from board."""
+		self.counts = counts
+		self.owners = owners
+		self.current = board.current
+		self.turns = board.turns
+		self.alive = tuple(board.alive)
+		self.cells = tuple(board.cells)
+		self.particles = tuple(board.particles)
+		self.occupied = board.occupied
+		self.hash = board.hash
+		self.parent = parent		# The State this move was played from
+		self.move = move		# The cell played to get here from parent
+		self.children = {}		# cell: the State playing it leads to
+		self.last = None		# The child we came back from, for redo
+
+	def after(self, board, cell, reaction):
+		"""Gives the State for board, which was in this State until cell was
+		played, causing reaction."""
+		if cell in self.children:
+			# Moves always lead to the same place
+			return self.children[cell]
+		numbers = set(changed / CHUNK for changed in board.region(cell, reaction))
+		counts = dict((number, board.counts[number * CHUNK:(number + 1) * CHUNK]) for number in numbers)
+		owners = dict((number, board.owners[number * CHUNK:(number + 1) * CHUNK]) for number in numbers)
+		child = State(board, replace(self.counts, counts), replace(self.owners, owners), self, cell)
+		self.children[cell] = child
+		return child
+
+	def line(self):
+		"""Gives the moves from the first State to this one."""
+		moves = []
+		state = self
+		while state.parent is not None:
+			moves.append(state.move)
+			state = state.parent
+		moves.reverse()
+		return moves
+
+def capture(board):
+	"""Gives a State for board with nothing shared, eg. at the start."""
+	return State(board, split(board.counts, 'H'), split(board.owners, 'b'))
+
+def load(board, state, previous, changes=True):
+	"""Put board, which is in the State previous, into state. Only the chunks
+	which differ are copied. Returns the cells which changed, unless changes
+	is False (which is quicker, eg. when searching)."""
+	changed = []
+	for number in sorted(set(differences(state.counts, previous.counts) + differences(state.owners, previous.owners))):
+		start = number * CHUNK
+		counts = state.counts[number / GROUP][number % GROUP]
+		owners = state.owners[number / GROUP][number % GROUP]
+		if changes:
+			changed.extend(start + place for place in xrange(len(counts))
+			               if board.counts[start + place] != counts[place] or board.owners[start + place] != owners[place])
+		board.counts[start:start + len(counts)] = counts
+		board.owners[start:start + len(owners)] = owners
+	board.current = state.current
+	board.turns = state.turns
+	board.alive = list(state.alive)
+	board.cells = array('l', state.cells)
+	board.particles = array('l', state.particles)
+	board.occupied = state.occupied
+	board.hash = state.hash
+	return sorted(set(changed))
+
+class History:
+	# Keeps a Board in step with a tree of States. Playing a move adds a
+	# State, undo and redo move back and forth, and playing something else
+	# after undoing starts a new branch without losing the old one
+
+	def __init__(self, board):
+		self.board = board
+		self.root = capture(board)
+		self.state = self.root
+		self.scratch = None		# A Board for branch to play on, and its State
+		self.scratch_state = None
+
+	def played(self, cell, reaction):
+		"""Remember that cell has been played on the Board, causing reaction."""
+		self.state = self.state.after(self.board, cell, reaction)
+
+	def go(self, state):
+		"""Put the Board in state. Returns the cells which changed."""
+		changed = load(self.board, state, self.state)
+		self.state = state
+		return changed
+
+	def undo(self):
+		"""Go back one move. Returns the cells which changed, or None if we
+		are at the start."""
+		if self.state.parent is None:
+			return None
+		self.state.parent.last = self.state.move
+		return self.go(self.state.parent)
+
+	def redo(self):
+		"""Play the move last undone again. Returns its cell and the cells
+		which changed, or None if there is nothing to redo."""
+		if self.state.last not in self.state.children:
+			return None
+		cell = self.state.last
+		return cell, self.go(self.state.children[cell])
+
+	def look(self, state):
+		"""Gives a Board in state (which must be in this History), without
+		changing our Board. It mustn't be changed, and is only in state until
+		the next call to look or branch."""
+		if self.scratch is None:
+			self.scratch = self.board.copy()
+			self.scratch_state = self.state
+		if state is not self.scratch_state:
+			load(self.scratch, state, self.scratch_state, False)
+			self.scratch_state = state
+		return self.scratch
+
+	def branch(self, state, cell):
+		"""Gives the State reached by playing cell in state (which must be in
+		this History), without changing the Board. Returns None if the move
+		is illegal. This is cheap, so States can be made for every node of an
+		analysis tree (as ai.Search does)."""
+		if cell in state.children:
+			return state.children[cell]
+		self.look(state)
+		reaction = self.scratch.move(cell)
+		if reaction is None:
+			return None
+		self.scratch_state = state.after(self.scratch, cell, reaction)
+		return self.scratch_state
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+# Works out what a move would do without playing it, for showing when the
+# cursor is over a cell. The move is played on a copy of the Board, and what
+# it did is remembered for each player and cell. A chain reaction only reads
+# the cells which explode and the cells next to them (its region), so what we
+# remembered stays right until a real move changes one of those cells. When a
+# move is played only the outcomes whose regions it touched are forgotten,
+# which on a big board is very few of them
+from board import NOBODY
+
+class Outcome:
+	# What playing a move would do. Only changes are kept, rather than the
+	# totals afterwards, so it stays right while other cells change
+
+	def __init__(self, board, cell):
+		"""Play cell on a copy of board to find out what happens."""
+		self.player = board.current
+		self.cell = cell
+		after = board.copy()
+		reaction = after.move(cell)
+		self.waves = len(reaction.waves)
+		self.explosions = len(reaction.exploded())
+		self.reason = reaction.reason
+		self.region = board.region(cell, reaction)
+		self.flipped = []		# Cells which would be taken from other players
+		self.cells = [0] * len(board.players)		# The change in cells each player owns
+		self.particles = [0] * len(board.players)		# And in their particles
+		others = 0		# Cells in the region owned by other players
+		for changed in self.region:
+			before_owner, after_owner = board.owners[changed], after.owners[changed]
+			if before_owner not in (NOBODY, self.player):
+				others += 1
+				if after_owner == self.player:
+					self.flipped.append(changed)
+			if before_owner != NOBODY:
+				self.cells[before_owner] -= 1
+				self.particles[before_owner] -= board.counts[changed]
+			if after_owner != NOBODY:
+				self.cells[after_owner] += 1
+				self.particles[after_owner] += after.counts[changed]
+		self.flipped.sort()
+		# Whether anyone else still has cells decides if a takeover stops the
+		# reaction early, so the outcome is only right while that stays the same
+		self.state = self.conditions(board, others)
+		self.others = others
+
+	def conditions(self, board, others):
+		"""Gives everything outside the region which the reaction depends on:
+		whether a takeover can stop it yet, and whether anyone else has cells
+		outside the region (so it can't)."""
+		outside = sum(board.cells) - board.cells[self.player] - others
+		return (len(board.alive) >= 2 and board.turns >= len(board.alive) - 1, outside > 0)
+
+	def valid(self, board):
+		"""Whether the outcome is still right for board, whose cells in our
+		region mustn't have changed since we were made."""
+		return board.current == self.player and self.conditions(board, self.others) == self.state
+
+	def scores(self, board):
+		"""Gives (player, cells, particles) for every player still in board
+		after the move, in turn order, as Board.scores does."""
+		scores = []
+		for player in board.alive:
+			cells = board.cells[player] + self.cells[player]
+			if cells or player == self.player or board.turns + 1 <= len(board.alive):
+				scores.append((player, cells, board.particles[player] + self.particles[player]))
+		return scores
+
+class OutcomeCache:
+	# Remembers Outcomes by player and cell, and which cells each one read so
+	# that they can be forgotten when those cells change
+
+	def __init__(self):
+		self.outcomes = {}		# (player, cell): Outcome
+		self.readers = {}		# cell: set of (player, cell) whose region holds it
+		self.hits = 0
+		self.misses = 0
+
+	def outcome(self, board, cell):
+		"""Gives the Outcome of the current player on board playing cell, or
+		None if it is illegal."""
+		if not board.legal(cell):
+			return None
+		key = (board.current, cell)
+		outcome = self.outcomes.get(key)
+		if outcome is not None and outcome.valid(board):
+			self.hits += 1
+			return outcome
+		self.misses += 1
+		if outcome is not None:
+			self.forget(key)
+		outcome = Outcome(board, cell)
+		self.outcomes[key] = outcome
+		for read in outcome.region:
+			self.readers.setdefault(read, set()).add(key)
+		return outcome
+
+	def forget(self, key):
+		"""Drop one Outcome."""
+		outcome = self.outcomes.pop(key)
+		for read in outcome.region:
+			self.readers[read].discard(key)
+
+	def played(self, board, cell, reaction):
+		"""Forget every Outcome which read a cell changed by a real move at
+		cell. board is the Board the move was played on."""
+		self.changed(board.region(cell, reaction))
+
+	def changed(self, cells):
+		"""Forget every Outcome which read any of cells."""
+		for changed in cells:
+			for key in list(self.readers.get(changed, ())):
+				self.forget(key)
+
+	def clear(self):
+		"""Forget everything, eg. when a different position is loaded."""
+		self.outcomes = {}
+		self.readers = {}
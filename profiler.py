@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+# The Profiler times named sections of code (behaviour callbacks, explosions,
+# image loading, painting and so on) and adds them up frame by frame. It also
+# keeps track of counters, such as how many actors are alive. When it is
+# turned off the sections cost next to nothing, so they can stay in the code
+import timeit
+
+# timeit picks the most accurate clock for the platform
+clock = timeit.default_timer
+
+class Section:
+	# Times everything inside a 'with' block and gives it to the Profiler
+
+	def __init__(self, profiler, name):
+		self.profiler = profiler
+		self.name = name
+		self.start = 0
+
+	def __enter__(self):
+		self.start = clock()
+		return self
+
+	def __exit__(self, kind, value, traceback):
+		self.profiler.add(self.name, clock() - self.start)
+		return False
+
+class Nothing:
+	# Used instead of a Section when the Profiler is turned off
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, kind, value, traceback):
+		return False
+
+# There is only ever need for one of these
+nothing = Nothing()
+
+class Profiler:
+	# Collects the timings and counters, and can write them out frame by frame
+	# to a CSV file for looking at later
+
+	def __init__(self, history=60):
+		"""history is how many frames to keep for working out averages."""
+		self.enabled = False
+		self.history = history
+		self.current = {}		# Seconds spent in each section this frame
+		self.calls = {}		# How many times each section ran this frame
+		self.counters = {}		# Functions giving each counter's value
+		self.frames = []		# The last few frames, oldest first
+		self.frame_number = 0
+		self.last_frame = None		# When the last frame finished
+		self.trace = None		# A file to write every frame to
+
+	def section(self, name):
+		"""Gives something to time a 'with' block as the named section."""
+		if self.enabled:
+			return Section(self, name)
+		return nothing
+
+	def add(self, name, seconds):
+		"""Count seconds as spent in the named section this frame."""
+		self.current[name] = self.current.get(name, 0.0) + seconds
+		self.calls[name] = self.calls.get(name, 0) + 1
+
+	def counter(self, name, function):
+		"""function will be called at the end of every frame, and whatever it
+		gives is recorded under name."""
+		self.counters[name] = function
+
+	def frame(self):
+		"""Finish off the current frame. This should be called once per frame,
+		eg. after the stage has painted."""
+		if not self.enabled:
+			return
+		now = clock()
+		if self.last_frame is None:
+			length = 0.0
+		else:
+			length = now - self.last_frame
+		self.last_frame = now
+		record = {'number':self.frame_number, 'time':now, 'length':length,
+		          'sections':self.current, 'calls':self.calls,
+		          'counters':dict((name, function()) for name, function in self.counters.items())}
+		self.frames.append(record)
+		if len(self.frames) > self.history:
+			del self.frames[0]
+		if self.trace is not None:
+			self.write(record)
+		self.current = {}
+		self.calls = {}
+		self.frame_number += 1
+
+	def start_trace(self, filename):
+		"""Write every frame to filename as CSV, one row per measurement."""
+		self.trace = open(filename, 'w')
+		self.trace.write('frame,time,kind,name,value\n')
+
+	def stop_trace(self):
+		"""Stop writing frames to the trace file."""
+		if self.trace is not None:
+			self.trace.close()
+			self.trace = None
+
+	def write(self, record):
+		"""Add the given frame to the trace file."""
+		rows = [('frame', 'length', record['length'])]
+		rows += [('section', name, seconds) for name, seconds in sorted(record['sections'].items())]
+		rows += [('calls', name, calls) for name, calls in sorted(record['calls'].items())]
+		rows += [('counter', name, value) for name, value in sorted(record['counters'].items())]
+		for kind, name, value in rows:
+			self.trace.write('%d,%f,%s,%s,%s\n' % (record['number'], record['time'], kind, name, value))
+
+	def summary(self):
+		"""Gives lines of text describing the last few frames."""
+		if not self.frames:
+			return ['No frames yet']
+		lengths = [frame['length'] for frame in self.frames if frame['length'] > 0]
+		lines = []
+		if lengths:
+			average = sum(lengths) / len(lengths)
+			lines.append('%.1f fps, %.1f ms/frame (worst %.1f)' % (1.0 / average, 1000 * average, 1000 * max(lengths)))
+		# Average each section over every frame, even those it didn't run in
+		totals = {}
+		for frame in self.frames:
+			for name, seconds in frame['sections'].items():
+				totals[name] = totals.get(name, 0.0) + seconds
+		for name, seconds in sorted(totals.items(), key=lambda item: -item[1]):
+			lines.append('%s: %.2f ms/frame' % (name, 1000 * seconds / len(self.frames)))
+		for name, value in sorted(self.frames[-1]['counters'].items()):
+			lines.append('%s: %s' % (name, value))
+		return lines
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+# Game records. A record is a short header (board size, seed, players and
+# the shape of the board)
+# followed by the cell of every move, each written as a varint so that most
+# moves take one or two bytes. Records can be written a move at a time while a
+# game is going on, and read back a move at a time. A Replay plays the moves
+# on a Board, without any graphics, and remembers a copy of the Board every so
+# often so that it can jump to any move without starting from the beginning
+from board import Board
+import topology as shapes
+
+# Every record starts with this, followed by the version number. Records from
+# version 1 didn't save the board's shape, which was always a rectangle
+MAGIC = 'GNUC'
+VERSION = 2
+
+class RecordError(Exception):
+	# Raised when a file isn't a game record we can read
+	pass
+
+def encode_varint(number):
+	"""Gives the bytes for a non-negative number as a varint: seven bits per
+	byte, lowest first, with the top bit set on every byte but the last."""
+	data = []
+	while number >= 0x80:
+		data.append(chr((number & 0x7F) | 0x80))
+		number >>= 7
+	data.append(chr(number))
+	return ''.join(data)
+
+def read_varint(stream):
+	"""Reads a varint from stream. Returns None if the stream has ended."""
+	number = 0
+	shift = 0
+	while True:
+		byte = stream.read(1)
+		if not byte:
+			if shift:
+				raise RecordError('record ends part way through a number')
+			return None
+		byte = ord(byte)
+		number |= (byte & 0x7F) << shift
+		if not byte & 0x80:
+			return number
+		shift += 7
+
+def read_string(stream):
+	"""Reads a string written as its length then its UTF-8 bytes."""
+	length = read_varint(stream)
+	if length is None:
+		raise RecordError('record ends in the header')
+	data = stream.read(length)
+	if len(data) != length:
+		raise RecordError('record ends in the header')
+	return data.decode('utf-8')
+
+def encode_string(text):
+	"""Gives the bytes for a string as its length then its UTF-8 bytes."""
+	data = unicode(text).encode('utf-8')
+	return encode_varint(len(data)) + data
+
+class GameRecord:
+	# Everything needed to play a game again: the board size and shape, the
+	# players in turn order, the random seed any bots used and the cell of
+	# each move
+
+	def __init__(self, (columns, rows), players, seed=0, moves=None, shape='rectangle', holes=()):
+		"""shape is the name of the board's shape (see topology.SHAPES) and
+		holes the cell numbers taken out of it."""
+		self.columns = columns
+		self.rows = rows
+		self.players = list(players)
+		self.seed = seed
+		if moves is None:
+			moves = []
+		self.moves = moves
+		self.shape = shape
+		self.holes = list(holes)
+
+	def header(self):
+		"""Gives the bytes which start the record."""
+		data = MAGIC + chr(VERSION)
+		data += encode_varint(self.columns) + encode_varint(self.rows)
+		data += encode_varint(self.seed)
+		data += encode_varint(len(self.players))
+		for player in self.players:
+			data += encode_string(player)
+		data += encode_string(self.shape)
+		data += encode_varint(len(self.holes))
+		data += ''.join(encode_varint(hole) for hole in self.holes)
+		return data
+
+	def write(self, stream):
+		"""Write the whole record to stream."""
+		stream.write(self.header())
+		stream.write(''.join(encode_varint(move) for move in self.moves))
+
+	def board(self):
+		"""Gives an empty Board to play this game on."""
+		return Board((self.columns, self.rows), self.players, shapes.build(self.shape, (self.columns, self.rows), self.holes))
+
+def read_header(stream):
+	"""Reads the header from stream. Returns a GameRecord with no moves."""
+	if stream.read(len(MAGIC)) != MAGIC:
+		raise RecordError('not a game record')
+	version = stream.read(1)
+	if not version or ord(version) not in (1, VERSION):
+		raise RecordError('unknown record version')
+	numbers = [read_varint(stream) for number in range(4)]
+	if None in numbers:
+		raise RecordError('record ends in the header')
+	columns, rows, seed, count = numbers
+	players = [read_string(stream) for player in range(count)]
+	if ord(version) == 1:
+		return GameRecord((columns, rows), players, seed)
+	shape = read_string(stream)
+	if shape not in shapes.SHAPES:
+		raise RecordError('unknown board shape %s' % shape)
+	count = read_varint(stream)
+	holes = [read_varint(stream) for hole in range(count or 0)]
+	if count is None or None in holes:
+		raise RecordError('record ends in the header')
+	return GameRecord((columns, rows), players, seed, shape=shape, holes=holes)
+
+def read_moves(stream):
+	"""Gives the moves from stream one at a time, after the header has been
+	read, so a record never has to be held in memory all at once."""
+	while True:
+		move = read_varint(stream)
+		if move is None:
+			return
+		yield move
+
+def read(stream):
+	"""Reads a whole record from stream. Returns a GameRecord."""
+	record = read_header(stream)
+	record.moves = list(read_moves(stream))
+	return record
+
+def load(filename):
+	"""Reads the record in the given file."""
+	stream = open(filename, 'rb')
+	try:
+		return read(stream)
+	finally:
+		stream.close()
+
+class RecordWriter:
+	# Writes a game to a file as it is played, so nothing is lost if the game
+	# is never finished
+
+	def __init__(self, filename, (columns, rows), players, seed=0, topology=None):
+		"""topology is the Topology the game is played on, a rectangle if it
+		isn't given."""
+		if topology is None:
+			topology = shapes.topology('rectangle', (columns, rows))
+		self.stream = open(filename, 'wb')
+		self.stream.write(GameRecord((columns, rows), players, seed, shape=topology.name, holes=topology.holes()).header())
+		self.stream.flush()
+		self.starts = []		# Where each move starts, so it can be taken back
+
+	def move(self, cell):
+		"""Add a move to the file."""
+		self.starts.append(self.stream.tell())
+		self.stream.write(encode_varint(cell))
+		self.stream.flush()
+
+	def undo(self):
+		"""Take the last move back off the end of the file."""
+		if self.starts:
+			self.stream.seek(self.starts.pop())
+			self.stream.truncate()
+			self.stream.flush()
+
+	def close(self):
+		self.stream.close()
+
+class Replay:
+	# Plays back a GameRecord on a Board. A copy of the Board is kept every
+	# interval moves, so going to a move only means playing on from the
+	# nearest copy before it
+
+	def __init__(self, record, interval=64):
+		self.record = record
+		self.interval = interval
+		# keyframes[n] is the Board after n * interval moves
+		self.keyframes = [record.board()]
+
+	def __len__(self):
+		return len(self.record.moves)
+
+	def position(self, number):
+		"""Gives a Board showing the game after the given number of moves. It
+		can be changed freely without affecting the Replay."""
+		if not 0 <= number <= len(self.record.moves):
+			raise IndexError('no move %d in a game of %d moves' % (number, len(self.record.moves)))
+		# Make any keyframes we haven't made yet on the way
+		while len(self.keyframes) <= number / self.interval:
+			board = self.keyframes[-1].copy()
+			start = (len(self.keyframes) - 1) * self.interval
+			for move in self.record.moves[start:start + self.interval]:
+				self.play(board, move)
+			self.keyframes.append(board)
+		board = self.keyframes[number / self.interval].copy()
+		for move in self.record.moves[number - number % self.interval:number]:
+			self.play(board, move)
+		return board
+
+	def play(self, board, move):
+		"""Play a move from the record, which must be legal."""
+		if board.move(move) is None:
+			raise RecordError('illegal move %d after %d turns' % (move, board.turns))
+
+	def final(self):
+		"""Gives a Board showing the end of the game."""
+		return self.position(len(self.record.moves))
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+# Draws boards with Cairo, without Clutter or a display, so that positions
+# can be saved as thumbnails and whole games as a sequence of PNG frames (eg.
+# for making into a video). Atoms are drawn from the same images and laid out
+# the same way as the Squares on the stage, with the electrons wherever their
+# orbits have taken them. Frames are shared out between a pool of processes.
+# Run with --help to see the options, eg.
+#   render.py game.gnuc --output frames --frames-per-move 5
+import math
+import optparse
+import os
+import sys
+import cairo
+from record import load, Replay
+# Frames are drawn in parallel if we can (from Python 2.6), and one at a time
+# if we can't. Only main needs this, so gnucleon can use the Renderer on 2.5
+try:
+	import multiprocessing
+except ImportError:
+	multiprocessing = None
+
+# Where the nucleons go in a Square, for each number of them, in eighths of
+# the Square from its centre. Square.arrange_nucleons uses these too. Cells on
+# hex boards hold up to 5 (6 as they explode), and any more than 6 (which only
+# happens part way through a chain reaction) are drawn over the first ones
+NUCLEONS = {1:[(0, 0)],
+            2:[(1, 0), (-1, 0)],
+            3:[(-1, 1), (1, 1), (0, -1)],
+            4:[(-1, 1), (1, -1), (1, 1), (-1, -1)],
+            5:[(-1, 1), (1, -1), (1, 1), (-1, -1), (0, 0)],
+            6:[(-1, 1), (1, 1), (2, 0), (1, -1), (-1, -1), (-2, 0)]}
+
+def nucleon_places(count):
+	"""Gives where each of count nucleons goes, from NUCLEONS."""
+	places = NUCLEONS[min(count, len(NUCLEONS))]
+	return [places[number % len(places)] for number in xrange(count)]
+
+# How many degrees the electrons go round their orbits each second, which is
+# the 359 degrees every 1.5 seconds of the electron timeline
+DEGREES_PER_SECOND = 359.0 / 1.5
+
+def particle_sizes((size_x, size_y)):
+	"""Gives how many pixels across electrons and nucleons are drawn in a
+	Square of the given size."""
+	return max(1, min(size_x, size_y) / 18), max(1, min(size_x, size_y) / 4)
+
+def orbits((size_x, size_y)):
+	"""Gives the electrons' orbits in a Square of the given size, as
+	(width, height, tilt). These are the same as Square.orbits. Electrons
+	after the last orbit go round the orbits again from the first."""
+	return [(size_x / 2, size_y / 8, 0),		# Horizontal
+	        (size_x / 8.0, size_y / 2, 0),		# Vertical
+	        (size_x / 8.0, size_y / 2, -45),		# Diagonal
+	        (size_x / 2, size_y / 8, -45),		# Antidiagonal
+	        (size_x / 2, size_y / 8, -22.5),		# Shallow diagonal
+	        (size_x / 8.0, size_y / 2, -22.5)]		# Steep diagonal
+
+def orbit_position((width, height, tilt), angle):
+	"""Gives where an electron angle degrees round an orbit is, from the
+	centre of the orbit. This is the ellipse of OrbitDriver."""
+	angle, tilt = math.radians(angle), math.radians(tilt)
+	return (width * math.cos(angle) * math.cos(tilt) - height * math.sin(angle) * math.sin(tilt),
+	        width * math.cos(angle) * math.sin(tilt) + height * math.sin(angle) * math.cos(tilt))
+
+def orbit_scale(angle):
+	"""Gives how much bigger or smaller an electron looks angle degrees round
+	its orbit, as it comes towards us and goes away."""
+	return math.cos(math.radians((angle / 2) - 45))**2 + 0.25
+
+class Renderer:
+	# Draws atoms and boards onto Cairo contexts. The images are loaded once
+	# each and kept
+
+	def __init__(self, directory='images'):
+		self.directory = directory		# Where the images live
+		self.surfaces = {}		# Loaded images, by name
+
+	def surface(self, name):
+		"""Gives the image called name (eg. 'electron_big') as a surface."""
+		if name not in self.surfaces:
+			self.surfaces[name] = cairo.ImageSurface.create_from_png(os.path.join(self.directory, name + '.png'))
+		return self.surfaces[name]
+
+	def draw_image(self, context, name, (x, y), size):
+		"""Draw the image called name size pixels across, centred on (x, y)."""
+		surface = self.surface(name)
+		scale = float(size) / max(surface.get_width(), surface.get_height())
+		context.save()
+		context.translate(x, y)
+		context.scale(scale, scale)
+		context.set_source_surface(surface, -surface.get_width() / 2.0, -surface.get_height() / 2.0)
+		context.paint()
+		context.restore()
+
+	def draw_atom(self, context, colour, count, (x, y), (size_x, size_y), angle=0):
+		"""Draw count particles belonging to colour in a Square of the given
+		size whose top left is at (x, y), with the electrons angle degrees
+		round their orbits."""
+		if count == 0:
+			return
+		electron_size, nucleon_size = particle_sizes((size_x, size_y))
+		centre_x = x + size_x / 2
+		centre_y = y + size_y / 2
+		for place_x, place_y in nucleon_places(min(count, len(NUCLEONS))):
+			self.draw_image(context, colour + 'proton_big', (centre_x + place_x * size_x / 8, centre_y + place_y * size_y / 8), nucleon_size)
+		# Only as many electrons as there are orbits go round
+		scale = orbit_scale(angle)
+		for orbit in orbits((size_x, size_y))[:count]:
+			offset_x, offset_y = orbit_position(orbit, angle)
+			self.draw_image(context, 'electron_big', (centre_x + offset_x, centre_y + offset_y), electron_size * scale)
+
+	def draw_board(self, context, board, (width, height), angle=0):
+		"""Draw board filling width by height pixels, laid out as the Grid
+		does it."""
+		context.set_source_rgb(0, 0, 0)
+		context.paint()
+		stagger = board.topology.stagger
+		size = (width / board.columns, int(height / (board.rows + stagger)))
+		for cell in xrange(board.size):
+			if board.counts[cell]:
+				column, row = board.position(cell)
+				place = (column * size[0], int((row + stagger * (column % 2)) * size[1]))
+				self.draw_atom(context, board.players[board.owners[cell]], board.counts[cell], place, size, angle)
+
+	def render(self, board, filename, (width, height), angle=0):
+		"""Save a picture of board as a PNG."""
+		surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+		context = cairo.Context(surface)
+		self.draw_board(context, board, (width, height), angle)
+		surface.write_to_png(filename)
+
+# Each worker process keeps its Replays and Renderers, so it only loads each
+# game and image once however many frames it draws
+replays = {}
+renderers = {}
+
+def render_frame((path, number, angle, filename, size, directory)):
+	"""Draw the game in the record at path after number moves to filename.
+	This runs in the worker processes."""
+	if path not in replays:
+		replays[path] = Replay(load(path))
+	if directory not in renderers:
+		renderers[directory] = Renderer(directory)
+	renderers[directory].render(replays[path].position(number), filename, size, angle)
+	return filename
+
+def frames(path, output, size, directory, frames_per_move=1, fps=25, moves=None):
+	"""Gives the work for drawing every frame of the game in the record at
+	path, into the directory output. Each move is shown for frames_per_move
+	frames, with the electrons moving as they would at fps frames a second."""
+	if moves is None:
+		moves = len(load(path).moves)
+	tasks = []
+	for frame in xrange((moves + 1) * frames_per_move):
+		angle = (frame * DEGREES_PER_SECOND / fps) % 360
+		tasks.append((path, frame / frames_per_move, angle, os.path.join(output, 'frame%05d.png' % frame), size, directory))
+	return tasks
+
+def parse_size(text):
+	"""Turns '800x600' into (800, 600)."""
+	return tuple(int(number) for number in text.split('x'))
+
+def main(arguments):
+	parser = optparse.OptionParser(usage='%prog [options] RECORD\n\nDraws every move of the game in RECORD (saved with gnucleon.py --record) as PNG frames, or one position with --thumbnail')
+	parser.add_option('-o', '--output', default='frames', help='directory to write the frames to [%default]')
+	parser.add_option('--size', default='800x600', help='size of each picture [%default]')
+	parser.add_option('--thumbnail', metavar='FILE', help='draw just one position (the end, unless --move is given) to FILE')
+	parser.add_option('--move', type='int', help='the number of moves into the game to draw with --thumbnail')
+	parser.add_option('--frames-per-move', type='int', default=1, help='frames to show each move for [%default]')
+	parser.add_option('--fps', type='int', default=25, help='frames per second the electrons move at [%default]')
+	parser.add_option('--workers', type='int', default=multiprocessing and multiprocessing.cpu_count() or 1, help='processes to draw in [%default]')
+	parser.add_option('--images', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images'),
+	                  help='where the images are [the images directory next to this file]')
+	options, rest = parser.parse_args(arguments)
+	if len(rest) != 1:
+		parser.error('give one game record')
+	path = os.path.abspath(rest[0])
+	size = parse_size(options.size)
+
+	if options.thumbnail:
+		replay = Replay(load(path))
+		if options.move is None:
+			board = replay.final()
+		else:
+			board = replay.position(options.move)
+		Renderer(options.images).render(board, options.thumbnail, size)
+		return
+
+	if not os.path.isdir(options.output):
+		os.makedirs(options.output)
+	tasks = frames(path, options.output, size, options.images, options.frames_per_move, options.fps)
+	if multiprocessing is None or options.workers == 1:
+		map(render_frame, tasks)
+		print 'wrote %d frames to %s' % (len(tasks), options.output)
+		return
+	pool = multiprocessing.Pool(options.workers)
+	try:
+		# Neighbouring frames go to the same worker, so its Replay only has to
+		# play on a few moves for each one
+		chunk = max(1, len(tasks) / (options.workers * 4))
+		pool.map(render_frame, tasks, chunk)
+	finally:
+		pool.terminate()
+	print 'wrote %d frames to %s' % (len(tasks), options.output)
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+
+# Board snapshots. Every snapshot of a given board takes the same number
+# of bytes, laid out the same way, so a file of them can be read through mmap:
+# snapshot n is simply at header size + n * snapshot size, and its counts and
+# owners can be looked at where they are (with NumPy if it is installed)
+# without unpickling or copying anything. The layout of the file is
+#
+#   header:   'GNSS', version (1 byte), columns, rows and number of players
+#             (2 bytes each), then each player's name as its length (2 bytes)
+#             and UTF-8 bytes, the name of the board's shape in the same way,
+#             the number of holes (4 bytes) and each hole's cell number (4
+#             bytes each), padded with zeros to a multiple of 8 bytes
+#   snapshot: turns (4 bytes), current player (1 byte), 3 bytes of padding,
+#             counts (2 bytes per cell), owners (1 byte per cell), whether
+#             each player is alive (1 byte per player), padded with zeros to
+#             a multiple of 8 bytes
+#
+# Everything is little endian
+import mmap
+import struct
+import sys
+from array import array
+from board import Board
+import topology as shapes
+# NumPy gives views of many snapshots at once, but we can do without it
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+MAGIC = 'GNSS'
+VERSION = 2
+
+class SnapshotError(Exception):
+	# Raised when a file isn't a snapshot store we can use
+	pass
+
+def padded(length):
+	"""Rounds length up to a multiple of 8."""
+	return (length + 7) & ~7
+
+def little_endian(numbers):
+	"""Gives the bytes of an array in little endian order."""
+	if sys.byteorder == 'big':
+		numbers = array(numbers.typecode, numbers)
+		numbers.byteswap()
+	return numbers.tostring()
+
+def from_little_endian(typecode, data):
+	"""Gives an array of the given type from little endian bytes."""
+	numbers = array(typecode)
+	numbers.fromstring(data)
+	if sys.byteorder == 'big':
+		numbers.byteswap()
+	return numbers
+
+def encode_string(text):
+	"""Gives the bytes for a string as its length (2 bytes) then its UTF-8
+	bytes."""
+	data = unicode(text).encode('utf-8')
+	return struct.pack('<H', len(data)) + data
+
+class Layout:
+	# Where everything is in a snapshot, for a particular board size, shape
+	# and players
+
+	def __init__(self, (columns, rows), players, shape='rectangle', holes=()):
+		"""shape is the name of the board's shape (see topology.SHAPES) and
+		holes the cell numbers taken out of it."""
+		self.columns = columns
+		self.rows = rows
+		self.size = columns * rows
+		self.players = list(players)
+		self.shape = shape
+		self.holes = list(holes)
+		self.topology = shapes.build(shape, (columns, rows), holes)
+		self.counts = 8		# Where the counts start
+		self.owners = self.counts + 2 * self.size
+		self.alive = self.owners + self.size
+		self.length = padded(self.alive + len(self.players))
+
+	def fits(self, board):
+		"""Whether board is the size and shape, and has the players, this
+		Layout is for."""
+		return (board.columns, board.rows) == (self.columns, self.rows) and list(board.players) == self.players \
+			and board.topology.name == self.shape and board.topology.holes() == self.holes
+
+	def header(self):
+		"""Gives the bytes of a file header for this layout."""
+		data = MAGIC + chr(VERSION)
+		data += struct.pack('<HHH', self.columns, self.rows, len(self.players))
+		for player in self.players:
+			data += encode_string(player)
+		data += encode_string(self.shape)
+		data += struct.pack('<I', len(self.holes)) + little_endian(array('I', self.holes))
+		return data + '\0' * (padded(len(data)) - len(data))
+
+	def pack(self, board):
+		"""Gives the bytes of a snapshot of board."""
+		alive = array('B', [0]) * len(self.players)
+		for player in board.alive:
+			alive[player] = 1
+		data = struct.pack('<IB3x', board.turns, board.current)
+		data += little_endian(board.counts) + board.owners.tostring() + alive.tostring()
+		return data + '\0' * (self.length - len(data))
+
+	def unpack(self, data):
+		"""Gives a new Board from the bytes of a snapshot."""
+		board = Board((self.columns, self.rows), self.players, self.topology)
+		board.turns, board.current = struct.unpack('<IB', str(data[:5]))
+		board.counts = from_little_endian('H', data[self.counts:self.owners])
+		board.owners = from_little_endian('b', data[self.owners:self.alive])
+		alive = data[self.alive:self.alive + len(self.players)]
+		board.alive = [player for player in range(len(self.players)) if alive[player] != '\0']
+		board.recount()
+		return board
+
+def field(data, place, length):
+	"""Gives length bytes of a file header from place, or raises a
+	SnapshotError if the file stops before then."""
+	if place + length > len(data):
+		raise SnapshotError('the snapshot store is cut off')
+	return data[place:place + length]
+
+def read_layout(data):
+	"""Reads a file header. Returns the Layout and where the snapshots start."""
+	if len(data) < len(MAGIC) or data[:len(MAGIC)] != MAGIC:
+		raise SnapshotError('not a snapshot store')
+	if ord(field(data, 4, 1)) != VERSION:
+		raise SnapshotError('unknown snapshot store version')
+	columns, rows, count = struct.unpack('<HHH', field(data, 5, 6))
+	place = 11
+	names = []
+	# The players' names, then the shape's
+	for name in range(count + 1):
+		length, = struct.unpack('<H', field(data, place, 2))
+		try:
+			names.append(field(data, place + 2, length).decode('utf-8'))
+		except UnicodeDecodeError:
+			raise SnapshotError('a name in the snapshot store is not UTF-8')
+		place += 2 + length
+	players, shape = names[:-1], str(names[-1])
+	if shape not in shapes.SHAPES:
+		raise SnapshotError('unknown board shape %s' % shape)
+	count, = struct.unpack('<I', field(data, place, 4))
+	holes = from_little_endian('I', field(data, place + 4, 4 * count)).tolist()
+	if [hole for hole in holes if hole >= columns * rows]:
+		raise SnapshotError('a hole is off the board')
+	place += 4 + 4 * count
+	field(data, place, padded(place) - place)
+	return Layout((columns, rows), players, shape, holes), padded(place)
+
+def snapshot(board):
+	"""Gives the bytes of a single snapshot of board, without a header."""
+	return board_layout(board).pack(board)
+
+def board_layout(board):
+	"""Gives the Layout for snapshots of board."""
+	return Layout((board.columns, board.rows), board.players, board.topology.name, board.topology.holes())
+
+class SnapshotWriter:
+	# Adds snapshots to the end of a file, making it (with its header) first
+	# if needed. Every Board written must be the same size and shape, with the
+	# same players, as the file was made for
+
+	def __init__(self, filename, (columns, rows), players, topology=None):
+		"""topology is the Topology of the Boards, a rectangle if it isn't
+		given."""
+		if topology is None:
+			topology = shapes.topology('rectangle', (columns, rows))
+		self.layout = Layout((columns, rows), players, topology.name, topology.holes())
+		try:
+			existing = open(filename, 'rb')
+		except IOError:
+			existing = None
+		if existing is None:
+			self.stream = open(filename, 'wb')
+			self.stream.write(self.layout.header())
+		else:
+			header = existing.read(len(self.layout.header()))
+			existing.close()
+			if header != self.layout.header():
+				raise SnapshotError('%s holds a different size or shape of board, or players' % filename)
+			self.stream = open(filename, 'ab')
+
+	def write(self, board):
+		"""Add a snapshot of board to the file."""
+		self.stream.write(self.layout.pack(board))
+		self.stream.flush()
+
+	def close(self):
+		self.stream.close()
+
+class SnapshotStore:
+	# Reads a file of snapshots through mmap. Nothing is read until it is
+	# looked at, and the views given out point straight into the file
+
+	def __init__(self, filename):
+		self.file = open(filename, 'rb')
+		try:
+			# An empty file can't be mapped at all
+			self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+		except (ValueError, mmap.error), error:
+			self.file.close()
+			raise SnapshotError('%s can not be read: %s' % (filename, error))
+		try:
+			self.layout, self.start = read_layout(self.map)
+		except SnapshotError:
+			self.close()
+			raise
+		self.count = (len(self.map) - self.start) / self.layout.length
+
+	def __len__(self):
+		return self.count
+
+	def offset(self, number):
+		"""Gives where snapshot number starts in the file."""
+		if not 0 <= number < self.count:
+			raise IndexError('no snapshot %d in a store of %d' % (number, self.count))
+		return self.start + number * self.layout.length
+
+	def view(self, number):
+		"""Gives the bytes of snapshot number, without copying them."""
+		return buffer(self.map, self.offset(number), self.layout.length)
+
+	def board(self, number):
+		"""Gives a new Board from snapshot number."""
+		return self.layout.unpack(self.view(number))
+
+	def turns(self, number):
+		"""Gives the turns taken in snapshot number."""
+		return struct.unpack_from('<I', self.map, self.offset(number))[0]
+
+	def counts(self, number=None):
+		"""Gives the counts of snapshot number, or of every snapshot as a
+		(snapshots, cells) array if number is None. These are NumPy arrays
+		looking straight into the file."""
+		return self.numpy_view(number, self.layout.counts, '<u2')
+
+	def owners(self, number=None):
+		"""Gives the owners of snapshot number, or of every snapshot as a
+		(snapshots, cells) array if number is None, in the same way as counts."""
+		return self.numpy_view(number, self.layout.owners, 'i1')
+
+	def numpy_view(self, number, place, dtype):
+		"""Gives a NumPy array of one cell-sized field, which starts at place
+		in each snapshot, for one or every snapshot."""
+		if numpy is None:
+			raise SnapshotError('views of many snapshots need NumPy')
+		if number is None:
+			return numpy.ndarray((self.count, self.layout.size), dtype, self.map,
+			                     self.start + place, (self.layout.length, numpy.dtype(dtype).itemsize))
+		return numpy.frombuffer(self.map, dtype, self.layout.size, self.offset(number) + place)
+
+	def close(self):
+		self.map.close()
+		self.file.close()
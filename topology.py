@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+# The shape of the board. A Topology says which cells are next to which, and
+# is worked out once when it is made: every cell's neighbours are stored one
+# after another in a flat array, with a second array saying where each cell's
+# run starts, and a cell's limit is how many neighbours it has. The Board only
+# ever looks things up in these, so any shape plays as fast as a rectangle.
+# Cells are numbered as on the Board, ie. (column, row) is column * rows + row
+from array import array
+
+class Topology:
+	# The neighbours and limits of every cell of some shape of board. Cells
+	# with no neighbours are holes, which can't be played on
+
+	def __init__(self, name, (columns, rows), neighbours, stagger=0.0):
+		"""neighbours gives the list of neighbours of a cell number. stagger
+		is how many rows every odd column is drawn down by, eg. 0.5 for hex
+		boards."""
+		self.name = name
+		self.columns = columns
+		self.rows = rows
+		self.size = columns * rows
+		self.stagger = stagger
+		self.starts = array('l', [0])		# Cell n's neighbours are table[starts[n]:starts[n + 1]]
+		self.table = array('l')
+		for cell in xrange(self.size):
+			self.table.extend(neighbours(cell))
+			self.starts.append(len(self.table))
+		self.limits = array('B', [self.starts[cell + 1] - self.starts[cell] for cell in xrange(self.size)])
+		# The most particles the board can hold with nothing left to explode.
+		# Explosions only move particles around, so a chain reaction on a
+		# board holding more than this can never settle
+		self.capacity = sum(limit - 1 for limit in self.limits if limit)
+		# The same runs as tuples, since Python loops over those far faster
+		# than over slices of the table
+		self.lists = tuple(tuple(self.table[self.starts[cell]:self.starts[cell + 1]]) for cell in xrange(self.size))
+
+	def neighbours(self, cell):
+		"""Gives the cells next to the given cell, which mustn't be changed."""
+		return self.lists[cell]
+
+	def hole(self, cell):
+		"""Whether there is no cell to play on here."""
+		return self.limits[cell] == 0
+
+	def cells(self):
+		"""Gives the cell numbers which aren't holes."""
+		return [cell for cell in xrange(self.size) if self.limits[cell]]
+
+	def holes(self):
+		"""Gives the cell numbers which are holes. With the name and size
+		these are everything needed to make the Topology again (see build)."""
+		return [cell for cell in xrange(self.size) if not self.limits[cell]]
+
+def rectangle((columns, rows)):
+	"""The usual board: up, down, left and right, so corners hold 2, edges 3
+	and everything else 4."""
+	def neighbours(cell):
+		column, row = divmod(cell, rows)
+		found = []
+		if row > 0:
+			found.append(cell - 1)
+		if row < rows - 1:
+			found.append(cell + 1)
+		if column > 0:
+			found.append(cell - rows)
+		if column < columns - 1:
+			found.append(cell + rows)
+		return found
+	return Topology('rectangle', (columns, rows), neighbours)
+
+def torus((columns, rows)):
+	"""A rectangle whose edges wrap round to the other side, so every cell
+	holds 4."""
+	def neighbours(cell):
+		column, row = divmod(cell, rows)
+		return [column * rows + (row - 1) % rows, column * rows + (row + 1) % rows,
+		        ((column - 1) % columns) * rows + row, ((column + 1) % columns) * rows + row]
+	return Topology('torus', (columns, rows), neighbours)
+
+def hexagonal((columns, rows)):
+	"""Hexagons, with every odd column half a cell lower than the even ones,
+	so a cell in the middle holds 6."""
+	def neighbours(cell):
+		column, row = divmod(cell, rows)
+		# The cells to the left and right are level with us and either half a
+		# row up (in an even column) or half a row down (in an odd one)
+		other = row - 1 + 2 * (column % 2)
+		found = []
+		for column_there, row_there in [(column, row - 1), (column, row + 1),
+		                                (column - 1, row), (column - 1, other),
+		                                (column + 1, row), (column + 1, other)]:
+			if 0 <= column_there < columns and 0 <= row_there < rows:
+				found.append(column_there * rows + row_there)
+		return found
+	return Topology('hex', (columns, rows), neighbours, 0.5)
+
+def masked(topology, holes):
+	"""Gives topology with the given cell numbers taken out. Nothing is next
+	to a hole, so the cells around it hold less."""
+	holes = set(holes)
+	def neighbours(cell):
+		if cell in holes:
+			return []
+		return [neighbour for neighbour in topology.neighbours(cell) if neighbour not in holes]
+	return Topology(topology.name, (topology.columns, topology.rows), neighbours, topology.stagger)
+
+def read_mask(stream):
+	"""Reads a picture of a board, one line per row, with '#' for a hole and
+	anything else for a cell. Gives the size and the holes' cell numbers."""
+	lines = [line.rstrip('\r\n') for line in stream if line.strip()]
+	rows = len(lines)
+	columns = max(len(line) for line in lines)
+	holes = [column * rows + row for row, line in enumerate(lines)
+	         for column in range(columns) if column >= len(line) or line[column] == '#']
+	return (columns, rows), holes
+
+# The shapes which can be asked for by name
+SHAPES = {'rectangle':rectangle, 'torus':torus, 'hex':hexagonal}
+
+# Boards of the same shape share their Topology, since making one is slow
+topologies = {}
+
+def topology(name, (columns, rows)):
+	"""Gives the Topology of the named shape and size."""
+	if (name, columns, rows) not in topologies:
+		topologies[(name, columns, rows)] = SHAPES[name]((columns, rows))
+	return topologies[(name, columns, rows)]
+
+def build(name, (columns, rows), holes=()):
+	"""Gives the Topology of the named shape and size with the given holes,
+	eg. as saved in a game record or snapshot. A cell whose neighbours are
+	all holes is a hole too, so holes from Topology.holes give the same
+	Topology back."""
+	if holes:
+		return masked(topology(name, (columns, rows)), holes)
+	return topology(name, (columns, rows))
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+# Plays bots against each other without a display, spread over every core.
+# Each game is a Board played to the end in a worker process, with its own
+# random seed worked out from the tournament's seed and the game's number, so
+# running the same tournament again plays the same games (except for 'time'
+# bots, whose searches depend on how fast the machine is). Run with --help to
+# see the options, eg.
+#   tournament.py --format swiss --rounds 5 random greedy depth:2 depth:3
+import json
+import multiprocessing
+import optparse
+import os
+import random
+import sys
+import ai
+from board import Board, parse_sizes
+from profiler import clock
+
+# Everyone starts with this Elo rating
+START_RATING = 1500.0
+
+# How far one game can move a rating
+K_FACTOR = 32.0
+
+def random_move(board, generator, argument):
+	"""Any legal move."""
+	return generator.choice(board.legal_moves())
+
+def greedy_move(board, generator, argument):
+	"""The move which leaves us furthest ahead straight away."""
+	search = ai.Search(board, 0)
+	moves = board.legal_moves()
+	generator.shuffle(moves)		# So ties aren't always broken the same way
+	best, best_score = None, None
+	for move, child in search.children(search.start, moves):
+		score = search.evaluate(child)
+		if best is None or score > best_score:
+			best, best_score = move, score
+	return best
+
+def depth_move(board, generator, argument):
+	"""Searches a fixed number of moves ahead (2 if not given), however long
+	that takes, so it always plays the same way."""
+	search = ai.Search(board, 0)
+	search.deadline = float('inf')
+	moves = board.legal_moves()
+	generator.shuffle(moves)
+	return search.root(int(argument or 2), moves)[0]
+
+def time_move(board, generator, argument):
+	"""Searches for a number of milliseconds (100 if not given), like a Bot."""
+	return ai.Search(board, int(argument or 100)).run().move
+
+# The bots which can be entered, by name. Each is given the Board, a Random
+# and whatever came after a ':' in its name (eg. 'depth:3'), or None
+STRATEGIES = {'random':random_move, 'greedy':greedy_move,
+              'depth':depth_move, 'time':time_move}
+
+def strategy(name):
+	"""Gives the function and argument for a bot's name."""
+	kind, colon, argument = name.partition(':')
+	if kind not in STRATEGIES:
+		raise ValueError('unknown bot %r (choose from %s)' % (name, ', '.join(sorted(STRATEGIES))))
+	return STRATEGIES[kind], argument or None
+
+def play_game((number, names, size, seed, max_moves)):
+	"""Plays one game in a worker process. names are the bots, in turn
+	order. Returns a dictionary describing how it went."""
+	generator = random.Random(seed)
+	players = [strategy(name) for name in names]
+	board = Board(size, names)
+	start = clock()
+	moves = 0
+	while board.winner() is None and moves < max_moves:
+		function, argument = players[board.current]
+		board.move(function(board, generator, argument))
+		moves += 1
+	return {'number':number, 'names':list(names), 'size':list(size),
+	        'winner':board.winner(), 'moves':moves, 'seconds':clock() - start,
+	        'worker':os.getpid()}
+
+class Tournament:
+	# Keeps the scores and ratings of the bots as games come in, and makes up
+	# the games for each round
+
+	def __init__(self, names, sizes, games, seed=0, max_moves=None):
+		"""names are the bots, sizes the (columns, rows) to play on and games
+		how many games each pair plays on each size (taking turns to go
+		first). max_moves stops games which go on too long, as a draw."""
+		self.names = list(names)
+		self.sizes = sizes
+		self.games = games
+		self.seed = seed
+		self.max_moves = max_moves
+		self.results = []
+		self.points = dict((name, 0.0) for name in self.names)
+		self.ratings = dict((name, START_RATING) for name in self.names)
+		self.met = set()		# The pairs who have already played
+		self.byes = set()		# Who has sat out a Swiss round
+		self.made = 0		# How many games have been made up
+
+	def pairing(self, first, second):
+		"""Gives the games for first against second."""
+		tasks = []
+		for size in self.sizes:
+			limit = self.max_moves or 20 * size[0] * size[1]
+			for game in range(self.games):
+				number = self.made
+				self.made += 1
+				names = (first, second) if game % 2 == 0 else (second, first)
+				# Every game gets its own seed, however the games are shared out
+				tasks.append((number, names, size, self.seed * 1000003 + number, limit))
+		self.met.add(frozenset((first, second)))
+		return tasks
+
+	def round_robin(self):
+		"""Gives every game of a round robin, where everyone plays everyone."""
+		tasks = []
+		for place, first in enumerate(self.names):
+			for second in self.names[place + 1:]:
+				tasks += self.pairing(first, second)
+		return tasks
+
+	def swiss_round(self):
+		"""Gives the games for the next round of a Swiss tournament: everyone
+		plays whoever is nearest them in the standings that they haven't
+		already played, if there is such a player. With an odd number of bots
+		the lowest placed one without a bye sits this round out."""
+		tasks = []
+		standing = sorted(self.names, key=lambda name: (-self.points[name], self.names.index(name)))
+		if len(standing) % 2:
+			waiting = [name for name in reversed(standing) if name not in self.byes]
+			resting = (waiting or list(reversed(standing)))[0]
+			self.byes.add(resting)
+			standing.remove(resting)
+		while standing:
+			first = standing.pop(0)
+			fresh = [name for name in standing if frozenset((first, name)) not in self.met]
+			second = (fresh or standing)[0]
+			standing.remove(second)
+			tasks += self.pairing(first, second)
+		return tasks
+
+	def record(self, results):
+		"""Takes in finished games, in game order so the ratings don't depend
+		on which worker finished first."""
+		for result in sorted(results, key=lambda result: result['number']):
+			first, second = result['names']
+			if result['winner'] is None:
+				score = 0.5		# A draw
+			else:
+				score = 1.0 - result['winner']
+			self.points[first] += score
+			self.points[second] += 1.0 - score
+			expected = 1.0 / (1.0 + 10 ** ((self.ratings[second] - self.ratings[first]) / 400.0))
+			self.ratings[first] += K_FACTOR * (score - expected)
+			self.ratings[second] -= K_FACTOR * (score - expected)
+			self.results.append(result)
+
+	def run(self, pool, format='round-robin', rounds=None):
+		"""Plays the whole tournament using the processes in pool."""
+		if format == 'round-robin':
+			self.record(pool.map(play_game, self.round_robin(), 1))
+		else:
+			if rounds is None:
+				# Enough rounds to tell the bots apart
+				rounds = max(1, (len(self.names) - 1).bit_length())
+			for number in range(rounds):
+				self.record(pool.map(play_game, self.swiss_round(), 1))
+
+	def standings(self):
+		"""Gives a dictionary for each bot, best first."""
+		rows = []
+		for name in self.names:
+			games = [result for result in self.results if name in result['names']]
+			won = [result for result in games if result['winner'] is not None and result['names'][result['winner']] == name]
+			drawn = [result for result in games if result['winner'] is None]
+			rows.append({'name':name, 'games':len(games), 'wins':len(won),
+			             'draws':len(drawn), 'points':self.points[name],
+			             'win_rate':len(won) / float(len(games) or 1),
+			             'elo':round(self.ratings[name], 1),
+			             'average_length':sum(result['moves'] for result in games) / float(len(games) or 1)})
+		return sorted(rows, key=lambda row: (-row['points'], -row['elo']))
+
+	def workers(self):
+		"""Gives a dictionary for each worker process, saying how much it did."""
+		totals = {}
+		for result in self.results:
+			games, moves, seconds = totals.get(result['worker'], (0, 0, 0.0))
+			totals[result['worker']] = (games + 1, moves + result['moves'], seconds + result['seconds'])
+		return [{'worker':worker, 'games':games, 'moves':moves, 'seconds':seconds,
+		         'moves_per_second':moves / seconds if seconds else 0.0}
+		        for worker, (games, moves, seconds) in sorted(totals.items())]
+
+def report(tournament, output):
+	"""Writes the standings and workers out as a table."""
+	output.write('%-12s %6s %5s %5s %7s %8s %7s %9s\n' % ('bot', 'games', 'wins', 'draws', 'points', 'win rate', 'elo', 'length'))
+	for row in tournament.standings():
+		output.write('%-12s %6d %5d %5d %7.1f %7.1f%% %7.1f %9.1f\n' % (row['name'], row['games'], row['wins'], row['draws'], row['points'], 100 * row['win_rate'], row['elo'], row['average_length']))
+	output.write('\n%-12s %6s %7s %10s\n' % ('worker', 'games', 'moves', 'moves/s'))
+	for row in tournament.workers():
+		output.write('%-12d %6d %7d %10.1f\n' % (row['worker'], row['games'], row['moves'], row['moves_per_second']))
+
+def main(arguments):
+	parser = optparse.OptionParser(usage='%prog [options] bot bot [bot...]\n\nbots are ' + ', '.join(sorted(STRATEGIES)) + ", optionally followed by ':' and a number, eg. depth:3 or time:250")
+	parser.add_option('--format', choices=['round-robin', 'swiss'], default='round-robin',
+	                  help='round-robin or swiss [%default]')
+	parser.add_option('--rounds', type='int', help='rounds of a Swiss tournament [enough to separate the bots]')
+	parser.add_option('--sizes', default='8x6', help='board sizes to play on [%default]')
+	parser.add_option('--games', type='int', default=10, help='games per pairing on each size [%default]')
+	parser.add_option('--max-moves', type='int', help='call a game a draw after this many moves [20 per cell]')
+	parser.add_option('--workers', type='int', default=multiprocessing.cpu_count(), help='processes to play in [%default]')
+	parser.add_option('--seed', type='int', default=0, help='random seed [%default]')
+	parser.add_option('--json', action='store_true', default=False, help='write JSON instead of a table')
+	parser.add_option('-o', '--output', help='write here instead of to stdout')
+	options, names = parser.parse_args(arguments)
+	if len(names) < 2:
+		parser.error('need at least two bots')
+	if len(set(names)) != len(names):
+		parser.error('every bot must be different')
+	for name in names:
+		try:
+			strategy(name)
+		except ValueError, error:
+			parser.error(str(error))
+
+	tournament = Tournament(names, parse_sizes(options.sizes), options.games, options.seed, options.max_moves)
+	pool = multiprocessing.Pool(options.workers)
+	start = clock()
+	try:
+		tournament.run(pool, options.format, options.rounds)
+	finally:
+		pool.terminate()
+	seconds = clock() - start
+
+	if options.output:
+		output = open(options.output, 'w')
+	else:
+		output = sys.stdout
+	if options.json:
+		json.dump({'format':options.format, 'seed':options.seed, 'seconds':seconds,
+		           'standings':tournament.standings(), 'workers':tournament.workers(),
+		           'games':tournament.results}, output, indent=1, sort_keys=True)
+		output.write('\n')
+	else:
+		report(tournament, output)
+		output.write('\n%d games in %.1f seconds\n' % (len(tournament.results), seconds))
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
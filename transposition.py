@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+# A transposition table remembers things about positions by their Zobrist hash
+# (see board.Zobrist), so that work done for a position reached one way can be
+# reused when it turns up again another way. It has a fixed number of slots so
+# it never grows, and when two positions want the same slot the one which took
+# more work to find out about is kept
+
+class TranspositionTable:
+	# Each slot holds a hash, a depth (how much work the value represents), the
+	# search it was stored in and the value itself
+
+	def __init__(self, bits=16):
+		"""The table has 2 ** bits slots."""
+		self.slots = 1 << bits
+		self.mask = self.slots - 1		# Turns a hash into a slot number
+		self.hashes = [None] * self.slots
+		self.depths = [0] * self.slots
+		self.ages = [0] * self.slots
+		self.values = [None] * self.slots
+		# Anything stored before the last call to new_search is fair game for
+		# replacing, even if it has a greater depth
+		self.age = 0
+		# How well the table is doing
+		self.hits = 0
+		self.misses = 0
+		self.stores = 0
+		self.replacements = 0
+
+	def lookup(self, hash, depth=0):
+		"""Gives the value stored for hash, as long as it was stored with at
+		least the given depth, or None if there isn't one."""
+		slot = hash & self.mask
+		if self.hashes[slot] == hash and self.depths[slot] >= depth:
+			self.hits += 1
+			return self.values[slot]
+		self.misses += 1
+		return None
+
+	def store(self, hash, value, depth=0):
+		"""Remember value for hash. If the slot is taken by another position
+		it is only replaced if ours is at least as deep, or theirs is left
+		over from an earlier search."""
+		slot = hash & self.mask
+		if self.hashes[slot] is not None and self.hashes[slot] != hash:
+			if self.depths[slot] > depth and self.ages[slot] == self.age:
+				return False
+			self.replacements += 1
+		self.hashes[slot] = hash
+		self.depths[slot] = depth
+		self.ages[slot] = self.age
+		self.values[slot] = value
+		self.stores += 1
+		return True
+
+	def new_search(self):
+		"""Mark everything stored so far as old, so it gives way to anything
+		stored from now on."""
+		self.age += 1
+
+	def clear(self):
+		"""Forget everything, but keep the statistics."""
+		self.hashes = [None] * self.slots
+		self.depths = [0] * self.slots
+		self.ages = [0] * self.slots
+		self.values = [None] * self.slots
+
+	def hit_rate(self):
+		"""Gives the fraction of lookups which found something."""
+		if self.hits + self.misses == 0:
+			return 0.0
+		return (self.hits + 0.0) / (self.hits + self.misses)
+
+	def statistics(self):
+		"""Gives a dictionary of how well the table is doing."""
+		return {'slots':self.slots, 'hits':self.hits, 'misses':self.misses,
+		        'stores':self.stores, 'replacements':self.replacements,
+		        'hit_rate':self.hit_rate()}